@@ -3,13 +3,14 @@ from typing import Literal
 import numpy as np
 
 from .component_factory import *
+from .utils import ArrayDict, BroadcastArrayDict, ScalarProperty
 
 
 
 def declare(unit: str, unit_comment: str, description: str,  min_value: float, max_value: float, value_comment: str, references: str, DOI: list,
               variable_type: Literal["state_variable", "plant_scale_state", "input", "parameter"], by: str,
               state_variable_type: Literal["massic_concentration", "intensive", "extensive", "NonInertialExtensive", "NonInertialIntensive", "descriptor"], 
-              edit_by: Literal["user", "dev"], default=None, default_factory=None):
+              edit_by: Literal["user", "dev"], default=None, default_factory=None, dtype=None):
     """
     Resulting from a consensus, this function is used to constrain component variables declaration in a dataclass in a commonly admitted way.
 
@@ -24,6 +25,7 @@ def declare(unit: str, unit_comment: str, description: str,  min_value: float, m
     :param by: which model is provider of the considered variable?
     :param state_variable_type: intensive (size invariant property) or extensive (size dependant property).
     :param edit_by: Explicit whether the considered default value could be superimposed only by a developer or a user. This can be used to exposed more precisely certain parametrization sensitive variables for user.
+    :param dtype: Optional storage dtype of the variable in array based data structures (example : np.float32). Takes precedence over the model precision_policy.
     :raise BadDefaultError: If '(type(min_value)==float and default < min_value) or (type(max_value)==float and default > max_value)':
     :raise BadUnitError: If 'unit not in dir(UnitRegistry())'
     :raise BadVariableTypeError: If 'variable_type not in ("input", "state_variable", "plant_scale_state", "parameter")'
@@ -35,13 +37,13 @@ def declare(unit: str, unit_comment: str, description: str,  min_value: float, m
                         metadata=dict(unit=unit, unit_comment=unit_comment, description=description, min_value=min_value,
                                     max_value=max_value, value_comment=value_comment, references=references, DOI=DOI,
                                     variable_type=variable_type, by=by,
-                                    state_variable_type=state_variable_type, edit_by=edit_by))
+                                    state_variable_type=state_variable_type, edit_by=edit_by, dtype=dtype))
     else:
         return field(default=default,
                         metadata=dict(unit=unit, unit_comment=unit_comment, description=description, min_value=min_value,
                                     max_value=max_value, value_comment=value_comment, references=references, DOI=DOI,
                                     variable_type=variable_type, by=by,
-                                    state_variable_type=state_variable_type, edit_by=edit_by))
+                                    state_variable_type=state_variable_type, edit_by=edit_by, dtype=dtype))
 
 
 
@@ -53,9 +55,20 @@ class Model:
 
     HYPOTHESES:
         self.g.properties() must have been stored self.props during child class __init__
+
+    precision_policy maps a variable name, a state_variable_type or a variable_type to a storage dtype, 
+    for example {"NonInertialExtensive": np.float32, "NonInertialIntensive": np.float32, "state_variable": np.float64}.
+    It can be superimposed through apply_scenario.
+
+    specialization_mode is "constant" to fold scalar parameters in the numba kernels generated for processes,
+    or "parametric" to pass them as a tuple argument, so that a single compilation serves every parameter set 
+    (plants of a scene with different parameters, parameter sweeps). None forbids the specialization of the processes 
+    of the model, unless they are decorated with specialized(True).
     """
 
     choregrapher = Choregrapher()
+    precision_policy = {}
+    specialization_mode = "constant"
     #available_inputs = []  # Will be incremented during the coupling
     # pullable_inputs = {}
 
@@ -107,6 +120,61 @@ class Model:
     def parameter(self):
         return [f.name for f in fields(self) if f.metadata["variable_type"] == "parameter"]
 
+    def dtype_of(self, name):
+        """
+        Storage dtype of a declared variable : the dtype passed to declare if any, 
+        else the first entry of precision_policy matching the variable name, its state_variable_type or its variable_type.
+        :return: numpy dtype, or None if nothing is specified (float64 or inferred)
+        """
+        metadata = self.__dataclass_fields__[name].metadata
+        if metadata.get("dtype") is not None:
+            return np.dtype(metadata["dtype"])
+        for key in (name, metadata.get("state_variable_type"), metadata.get("variable_type")):
+            if key in self.precision_policy:
+                return np.dtype(self.precision_policy[key])
+        return None
+
+    def apply_precision_policy(self, policy):
+        """
+        Gives policy to the model if it does not define its own, 
+        and casts the array based state variables already created by link_self_to_mtg to the resulting dtypes.
+        """
+        if self.precision_policy:
+            return
+        self.precision_policy = policy
+        for name in self.state_variables:
+            prop, dtype = self.props.get(name), self.dtype_of(name)
+            if dtype is not None and isinstance(prop, ArrayDict) and prop.dtype != dtype:
+                prop.cast(dtype)
+        self.choregrapher.invalidate_plans()
+
+    def new_property(self, name):
+        """
+        Empty storage for a per-vertex property, matching the one already used in self.props : 
+        an ArrayDict in the declared dtype sharing the vertex index of struct_mass if props are array based, a dict otherwise.
+        """
+        reference = self.props.get("struct_mass")
+        if not isinstance(reference, ArrayDict):
+            return {}
+        return ArrayDict(dtype=self.dtype_of(name) or np.float64, index=reference.index)
+
+    def vertices_cover_props(self):
+        """Whether props are array based and self.vertices are exactly the vertices of their shared index."""
+        reference = self.props.get("struct_mass")
+        if not isinstance(reference, ArrayDict) or len(self.vertices) != len(reference):
+            return False
+        return np.array_equal(np.sort(np.asarray(self.vertices, dtype=np.int64)), reference.keys_array())
+
+    def broadcast_default(self, name):
+        """
+        Copy-on-write property holding the default of name on every vertex (see BroadcastArrayDict), 
+        or None if this default is not a numeric scalar. Supposes vertices_cover_props().
+        """
+        value = getattr(self, name)
+        if not isinstance(value, (int, float, np.number, np.bool_)):
+            return None
+        return BroadcastArrayDict(value, index=self.props["struct_mass"].index, dtype=self.dtype_of(name) or np.float64)
+
     def apply_scenario(self, **kwargs):
         """
         Method to superimpose default parameters in order to create a scenario.
@@ -116,33 +184,61 @@ class Model:
         for changed_parameter, value in kwargs.items():
             if changed_parameter in dir(self):
                 setattr(self, changed_parameter, value)
+        # Parameters of parametric kernels are packed again
+        self.choregrapher.invalidate_plans()
 
     def link_self_to_mtg(self, ignore=[]):
+        # With array based props, homogeneous defaults are stored once per property and only copied per vertex on first write
+        broadcastable = self.vertices_cover_props()
+
         # for input variables, initialize homogeneous values on each vertices. 
         # This behavior will be overwritten in case of module providing the input variable
         for name in self.inputs:
             if not (name in self.props.keys() and len(self.props[name]) == len(self.vertices)): 
                 # if it is not provided by mtg file, Use by default value everywhere
-                self.props.setdefault(name, {})
+                if broadcastable and name not in self.props:
+                    broadcast = self.broadcast_default(name)
+                    if broadcast is not None:
+                        self.props[name] = broadcast
+                        continue
+                if name not in self.props:
+                    self.props[name] = self.new_property(name)
                 self.props[name].update({key: getattr(self, name) for key in self.vertices})
 
         # for segment scale state variables
         for name in self.state_variables:
             if name not in ignore:
-                self.props.setdefault(name, {})
+                if broadcastable and (name not in self.props or (isinstance(self.props[name], BroadcastArrayDict) and not self.props[name].materialized)):
+                    broadcast = self.broadcast_default(name)
+                    if broadcast is not None:
+                        self.props[name] = broadcast
+                        continue
+                if name not in self.props:
+                    self.props[name] = self.new_property(name)
                 # set default in mtg, state_variable prevail on inputs
                 self.props[name].update({key: getattr(self, name) for key in self.vertices})
 
-        # for plant scale state variables
+        # for plant scale state variables, stored as a single scalar
         for name in self.plant_scale_state:
-            self.props.setdefault(name, {})
             # set default in mtg, state_variable prevail on inputs
-            self.props[name].update({1: getattr(self, name)})
+            if isinstance(self.props.get(name), ScalarProperty):
+                self.props[name].value = getattr(self, name)
+            else:
+                self.props[name] = ScalarProperty(getattr(self, name))
+
+        # Scheduled functors resolved their properties against the previous ones
+        self.choregrapher.invalidate_plans()
                 
 
     def pull_available_inputs(self):
         props = self.props
         for input, source_variables in self.pullable_inputs.items():
+            sources = [props[variable] for variable in source_variables.keys()]
+            if isinstance(props[input], ArrayDict) and all(isinstance(source, ArrayDict) and sources[0].aligned_with(source) for source in sources):
+                # Vectorized weighted sum of the aligned source arrays
+                props[input].update(sum(source * unit_conversion for source, unit_conversion in zip(sources, source_variables.values())))
+                continue
+
             vertices = props[list(source_variables.keys())[0]].keys()
             props[input].update({vid: sum([props[variable][vid]*unit_conversion 
                                            for variable, unit_conversion in source_variables.items()]) 
@@ -1,7 +1,14 @@
 import inspect as ins
+import os, csv, json, threading
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
 from typing import get_type_hints, get_origin, get_args
 from functools import partial
-from openalea.metafspm.specializer import specialize_method_recursive
+import numba
+from numba.core.errors import TypingError
+from openalea.metafspm.specializer import (specialize_method_recursive, vectorize_method, writes_instance_attributes, fuse_kernels, pack_parameters,
+                                           supplementary_output_names, is_elementwise, writes_arguments, without_parallel_warnings)
+from openalea.metafspm.utils import ArrayDict, BroadcastArrayDict, ScalarProperty, FocusElements
 
 # TP
 import time
@@ -9,17 +16,55 @@ import time
 # General process resolution method
 class Functor:
     numba_speedup = False
+    # Whether the specialized kernel releases the GIL, and whether it is split across numba threads
+    fun_nogil = False
+    fun_parallel = False
+    # For kernels specialized in parametric mode, callable packing the current parameters tuple passed as last argument
+    parameters = None
+    # (kernel, parameters, nogil, parallel) compiled in background, installed by the executing thread on next call
+    pending = None
+    # Whether the python function can be called once on whole gathered arrays (None until tried)
+    numpy_vectorized = None
+    # Above this fraction of focus elements among vertices, numba kernels run on whole contiguous arrays 
+    # and only focus elements results are written back, instead of gathering and scattering focus elements values
+    dense_coverage_threshold = 0.9
+    dense_dispatch = True
     
     def __init__(self, fun, iteraring: bool = False, total: bool = False):
         self.fun = fun
+        # Original python function, kept as fallback if specialized versions fail
+        self.py_fun = fun
         self.name = self.fun.__name__[1:]
         self.class_name = self.fun.__qualname__.split('.')[0]
         self.iterating = iteraring
         self.total = total
         self.input_names = self.inputs(self.fun)
         self.supplementary_outputs = int((self.num_outputs(fun) - 1) / 2)
+        # Statically known names of the supplementary outputs, None if they are only known at run time
+        self.supplementary_names = supplementary_output_names(fun) if self.supplementary_outputs else []
         if len(self.input_names) == 0:
             self.iterating = True
+        self.stats = dict(dense_calls=0, gather_calls=0, gathered_elements=0, scattered_elements=0)
+        # True forces and False forbids the numba specialization of this process, None follows its model (see specialized)
+        self.specialization = getattr(fun, "specialization", None)
+        self.specialization_failure = None
+        self.compile_time = 0.
+
+    def install(self, fun, parameters=None, nogil=False, parallel=False):
+        """Switch to the numba kernel fun."""
+        self.fun, self.parameters, self.fun_nogil, self.fun_parallel = fun, parameters, nogil, parallel
+        self.numba_speedup = True
+        self.pending = None
+
+    def fall_back(self, error):
+        """Back to the python function for good, after the numba kernel failed on actual arguments."""
+        self.fun, self.numba_speedup = self.py_fun, False
+        self.specialization_failure = "numba typing error on call: " + next((line.strip() for line in str(error).splitlines()[1:] if line.strip()), "")
+
+    def install_pending(self):
+        pending = self.pending
+        if pending is not None:
+            self.install(*pending)
 
     def inputs(self, fun):
         arguments = ins.getfullargspec(fun)[0]
@@ -44,78 +89,606 @@ class Functor:
             return 1
         
 
-    def __call__(self, instance, data, data_type="<class 'dict'>", *args):
+    def store_total(self, data, value):
+        target = data[self.name]
+        if isinstance(target, ScalarProperty):
+            target.value = value
+        else:
+            target.update({1: value})
+
+    def total_arguments(self, data):
+        """
+        Specialized total functors get whole segment arrays and plant scale scalars. 
+        Arrays being the stored values, they are read-only views, or copies for kernels writing their arguments.
+        """
+        protect = np.copy if writes_arguments(self.fun) else readonly
+        for arg in self.input_names:
+            prop = data[arg]
+            if isinstance(prop, ScalarProperty):
+                yield prop.value
+            elif isinstance(prop, ArrayDict):
+                yield protect(prop.values_array())
+            else:
+                yield prop
+
+    def gather(self, data, mask):
+        """Input values of the focus elements, plant scale scalars being passed as such."""
+        for arg in self.input_names:
+            prop = data[arg]
+            if isinstance(prop, ScalarProperty):
+                yield prop.value
+            else:
+                yield prop.values_array()[mask]
+
+    def call_on_arrays(self, instance, data, mask, gather=None):
+        """
+        Middle tier between numba kernels and per element calls : the python function is called once on gathered arrays,
+        which works for numpy-safe processes (arithmetic, np.where, ufuncs...). 
+        Otherwise, a version where scalar branches are rewritten as numpy operations is tried (see specializer.vectorize_method).
+        Floating point errors are raised so that they are reported as they would be by per element calls.
+        :param gather: callable returning the gathered input arguments, self.gather by default
+        :return: False if no call succeeded in returning one value per element, nothing being written in that case.
+        """
+        if gather is None:
+            gather = lambda: list(self.gather(data, mask))
+        if self.numpy_vectorized is None:
+            self.array_funs = []
+            # Processes editing the instance would not be called once per element anymore
+            if not writes_instance_attributes(self.py_fun):
+                self.array_funs.append(self.py_fun)
+                vectorized = vectorize_method(self.py_fun, type(instance))
+                if vectorized is not None:
+                    self.array_funs.append(vectorized)
+            self.numpy_vectorized = len(self.array_funs) > 0
+
+        n = mask.size
+        while self.array_funs:
+            try:
+                with np.errstate(divide="raise", invalid="raise"):
+                    out = self.array_funs[0](instance, *gather())
+                outputs = out if self.supplementary_outputs != 0 else (out,)
+                names = [outputs[2*s + 1] for s in range(self.supplementary_outputs)]
+                values = [np.asarray(outputs[2*s]) for s in range(self.supplementary_outputs + 1)]
+            except Exception:
+                self.array_funs.pop(0)
+                continue
+
+            if (not all(isinstance(name, str) for name in names) 
+                or any(v.dtype == object or v.ndim > 1 or (v.ndim == 1 and v.shape[0] != n) for v in values)):
+                self.array_funs.pop(0)
+                continue
+
+            # Scalar outputs are constant for all elements
+            data[self.name].assign_at(mask, np.broadcast_to(values[0], (n,)))
+            for name, v in zip(names, values[1:]):
+                data[name].assign_at(mask, np.broadcast_to(v, (n,)))
+            return True
+
+        self.numpy_vectorized = False
+        return False
+
+    def per_element(self, instance, data, inputs, focus, fun=None):
+        """Dictionnary-based computations, calling the python function once per focus element."""
+        fun = self.py_fun if fun is None else fun
+        if self.supplementary_outputs != 0:
+            outputs = [{} for _ in range(self.supplementary_outputs + 1)]
+            supplementary_names = []
+            for vid in focus:
+                out = fun(instance, *(prop[vid] for prop in inputs))
+                outputs[0][vid] = out[0]
+                for s in range(self.supplementary_outputs):
+                    output_name = out[2*s + 1]
+                    if output_name not in supplementary_names:
+                        supplementary_names.append(output_name)
+                    outputs[s+1][vid] = out[2*s + 2]
+            data[self.name].update(outputs[0])
+            for k, name in enumerate(supplementary_names):
+                data[name].update(outputs[k+1])
+        else:
+            data[self.name].update({vid: fun(instance, *(prop[vid] for prop in inputs)) for vid in focus})
+
+    def compile(self, instance, data, data_type=dict, timing=None):
+        """
+        Resolves once the computation branch matching data_type, the input properties, the output target and the focus elements mask.
+        The returned closure is only valid as long as the data structure does not change (see FunctorPlan).
+        :param data_type: type of the data structure properties (or its string representation)
+        :param timing: if given, dict in which the time spent gathering and scattering focus elements values is accumulated
+        under "gather" and "scatter" keys (see Profiler)
+        :return: a closure without arguments performing the functor call
+        """
+        kind = data_kind(data_type)
+        fun = self.fun
+        if self.numba_speedup and self.fun_parallel:
+            fun = without_parallel_warnings(fun)
         if self.iterating:
-            self.fun(instance)
-        elif data_type == "<class 'dict'>":
-            if self.total:
-                data[self.name].update(
-                    {1: self.fun(instance, *(data[arg] for arg in self.input_names))})
+            return partial(fun, instance)
+
+        if kind == "ndarray":
+            # Arrays are replaced by outputs, so they are looked up at each call
+            def run():
+                data[self.name] = fun(instance, *(data[arg] for arg in self.input_names))
+            return run
+
+        inputs = [data[arg] for arg in self.input_names]
+        target = data[self.name]
+        extra = (self.parameters(),) if self.numba_speedup and self.parameters is not None else ()
+
+        if self.total:
+            if isinstance(target, ScalarProperty):
+                def store(value):
+                    target.value = value
             else:
-                if self.supplementary_outputs != 0:
-                    outputs = [{} for _ in range(self.supplementary_outputs + 1)]
-                    supplementary_names = []
-                    for vid in data["focus_elements"]:
-                        out = self.fun(instance, *(data[arg][vid] for arg in self.input_names))
-                        outputs[0][vid] = out[0]
-                        for s in range(self.supplementary_outputs):
-                            output_name = out[2*s + 1]
-                            if output_name not in supplementary_names:
-                                supplementary_names.append(output_name)
-                            outputs[s+1][vid] = out[2*s + 2]
-                            
-                    data[self.name].update(outputs[0])
-                    for k, name in enumerate(supplementary_names):
-                        data[name].update(outputs[k+1])
-                else:
-                    # print(self.name, [arg for arg in self.input_names if 254 not in data[arg].keys()])
-                    data[self.name].update(
-                        {vid: self.fun(instance, *(data[arg][vid] for arg in self.input_names)) for vid in data["focus_elements"]})
-                
-        elif data_type == "<class 'openalea.metafspm.utils.ArrayDict'>":
-            if self.total:
-                data[self.name].update(
-                    {1: self.fun(instance, *(data[arg] for arg in self.input_names))})
+                def store(value):
+                    target.update({1: value})
+
+            if kind == "arraydict" and self.numba_speedup:
+                # Vectorized reduction written directly in the plant scale scalar
+                def run():
+                    try:
+                        store(fun(*self.total_arguments(data), *extra))
+                        return
+                    except TypingError as error:
+                        # Arguments the specialized version cannot handle, back to the python function for good
+                        self.fall_back(error)
+                    store(self.py_fun(instance, *inputs))
             else:
-                # Array based and numba accelerated computations if compatible
-                if self.numba_speedup:
-                    mask = data["vertex_index"].indices_of(data["focus_elements"])
-                    
-                    if self.supplementary_outputs != 0:
-                        out = self.fun(*(data[arg].values_array()[mask] for arg in self.input_names))
-                        data[self.name].assign_at(mask, out[0])
-                        for s in range(self.supplementary_outputs):
-                            data[out[2*s + 1]].assign_at(mask, out[2*s + 2])
-                    else:
-                        # print(self.name, {arg: data[arg] for arg in self.input_names})
-                        data[self.name].assign_at(mask, self.fun(*(data[arg].values_array()[mask] for arg in self.input_names)))
+                def run():
+                    store(fun(instance, *inputs))
+            return run
 
-                # Else per element dictionnary-based computations
-                else:
-                    if self.supplementary_outputs != 0:
-                        outputs = [{} for _ in range(self.supplementary_outputs + 1)]
-                        supplementary_names = []
-                        for vid in data["focus_elements"]:
-                            out = self.fun(instance, *(data[arg][vid] for arg in self.input_names))
-                            outputs[0][vid] = out[0]
-                            for s in range(self.supplementary_outputs):
-                                output_name = out[2*s + 1]
-                                if output_name not in supplementary_names:
-                                    supplementary_names.append(output_name)
-                                outputs[s+1][vid] = out[2*s + 2]
-                        data[self.name].update(outputs[0])
-                        for k, name in enumerate(supplementary_names):
-                            data[name].update(outputs[k+1])
-
-                    
+        focus = data["focus_elements"]
+        if kind == "dict":
+            def run():
+                self.per_element(instance, data, inputs, focus, fun)
+            return run
+        if any(isinstance(prop, dict) for prop in inputs):
+            # Inputs left as plain dicts (string properties, unconverted MTG properties) are only read per element
+            def run():
+                self.per_element(instance, data, inputs, focus)
+            return run
+
+        vertex_index = data["vertex_index"]
+        index = getattr(vertex_index, "index", vertex_index)
+        if isinstance(focus, FocusElements) and focus.index is index:
+            # Gather indices shared by all functors, only recomputed after structural changes
+            slots, focus_mask = focus.slots, focus.mask
+        else:
+            mask = vertex_index.indices_of(focus)
+            selected = np.zeros(len(index), dtype=bool)
+            selected[mask] = True
+            slots, focus_mask = (lambda: mask), (lambda: selected)
+        getters = [(lambda m, p=prop: p.value) if isinstance(prop, ScalarProperty) else (lambda m, v=prop.values_array: v()[m])
+                   for prop in inputs]
+        # Whole arrays are the stored values, passed as read-only views, or copies for kernels writing their arguments
+        protect = np.copy if self.numba_speedup and writes_arguments(self.fun) else readonly
+        array_getters = [(lambda p=prop: p.value) if isinstance(prop, ScalarProperty) else (lambda v=prop.values_array: protect(v()))
+                         for prop in inputs]
+        n_arrays = sum(not isinstance(prop, ScalarProperty) for prop in inputs)
+
+        def gather(mask):
+            return [get(mask) for get in getters]
+
+        if timing is not None:
+            gather = timed(gather, timing, "gather")
+
+        # Else single whole-array call of the python function if it supports it, or per element computations
+        def fallback():
+            mask = slots()
+            if self.numpy_vectorized is not False and self.call_on_arrays(instance, data, mask, lambda: gather(mask)):
+                return
+            self.per_element(instance, data, inputs, focus)
+
+        if not self.numba_speedup:
+            return fallback
+
+        # Array based and numba accelerated computations
+        stats = self.stats
+        n_outputs = self.supplementary_outputs + 1
+
+        def write(prop, values, selected):
+            # Post-mask of whole array results, only focus elements being written
+            np.copyto(prop.arr[:prop.size], values, where=selected, casting="unsafe")
+
+        def scatter(prop, mask, values):
+            prop.assign_at(mask, values)
+
+        if timing is not None:
+            write, scatter = timed(write, timing, "scatter"), timed(scatter, timing, "scatter")
+
+        def gather_kernel(mask):
+            stats["gather_calls"] += 1
+            stats["gathered_elements"] += n_arrays * mask.size
+            stats["scattered_elements"] += n_outputs * mask.size
+            out = fun(*gather(mask), *extra)
+            if n_outputs == 1:
+                scatter(target, mask, out)
+                return
+            scatter(target, mask, out[0])
+            for s in range(self.supplementary_outputs):
+                scatter(data[out[2*s + 1]], mask, out[2*s + 2])
+
+        def dense_kernel():
+            selected = focus_mask()
+            out = fun(*(get() for get in array_getters), *extra)
+            if n_outputs == 1:
+                write(target, out, selected)
+            else:
+                write(target, out[0], selected)
+                for s in range(self.supplementary_outputs):
+                    write(data[out[2*s + 1]], out[2*s + 2], selected)
+            stats["dense_calls"] += 1
+
+        # Whole arrays only give the focus elements results of elementwise kernels (no reduction over all vertices)
+        dense = is_elementwise(self.fun)
+
+        def kernel():
+            mask = slots()
+            if dense and self.dense_dispatch and mask.size >= self.dense_coverage_threshold * len(index):
+                try:
+                    dense_kernel()
+                    return
+                except TypingError:
+                    raise
+                except Exception:
+                    # Values of non focus elements the kernel cannot process, focus elements are gathered from now on
+                    self.dense_dispatch = False
+            gather_kernel(mask)
+
+        def run():
+            try:
+                kernel()
+                return
+            except TypingError as error:
+                # Arguments the specialized version cannot handle, back to the python function for good
+                self.fall_back(error)
+            fallback()
+        return run
+
+    def tier(self) -> str:
+        """Execution tier the functor currently runs on."""
+        if self.iterating:
+            return "iterating"
+        if self.numba_speedup:
+            return "numba"
+        if self.pending is not None:
+            return "compiled, pending"
+        return {True: "numpy", False: "per element"}.get(self.numpy_vectorized, "python, not run yet")
+
+    def specialization_report(self) -> dict:
+        """Execution tier, reason why specialization failed if it did, and compilation time in seconds."""
+        return dict(tier=self.tier(), specialization=self.specialization, failure=self.specialization_failure, 
+                    compile_time=self.compile_time)
+
+    def dispatch_stats(self) -> dict:
+        """Counts of whole array and gathered kernel calls, with the fraction of calls that gathered and scattered focus elements."""
+        stats = dict(self.stats)
+        calls = stats["dense_calls"] + stats["gather_calls"]
+        stats["gather_fraction"] = stats["gather_calls"] / calls if calls else 0.
+        return stats
+
+    def __call__(self, instance, data, data_type=dict, *args):
+        self.compile(instance, data, data_type)()
+
+
+def readonly(array):
+    """Read-only view of array."""
+    view = array.view()
+    view.flags.writeable = False
+    return view
+
+
+def timed(function, timing, key):
+    """function accumulating its wall time in timing[key]."""
+    def run(*args):
+        start = time.perf_counter()
+        result = function(*args)
+        timing[key] += time.perf_counter() - start
+        return result
+    return run
+
+
+def data_kind(data_type):
+    """Computation branch of a data structure whose properties are of type data_type (or its string representation)."""
+    if isinstance(data_type, type):
+        if issubclass(data_type, ArrayDict):
+            return "arraydict"
+        if issubclass(data_type, np.ndarray):
+            return "ndarray"
+        return "dict"
+    return {"<class 'openalea.metafspm.utils.ArrayDict'>": "arraydict", "<class 'numpy.ndarray'>": "ndarray"}.get(data_type, "dict")
+
+
+class FunctorPlan:
+    """
+    Functor call bound to a model instance and its data structure, compiled once into a closure by Functor.compile.
+    The closure is rebuilt when the structure it was resolved against changes : vertex index edits (segmentation), 
+    new focus_elements, replaced properties, fall back of the functor to an other tier, or Choregrapher.invalidate_plans (coupling).
+    """
+    def __init__(self, functor, instance, data, data_type, choregrapher):
+        self.functor = functor
+        self.instance = instance
+        self.data = data
+        self.data_type = data_type
+        self.choregrapher = choregrapher
+        self.run = None
+        self.key = None
+        self.focus = None
+        self.timing = dict(gather=0., scatter=0.)
+
+    def structure_key(self):
+        vertex_index = self.data.get("vertex_index")
+        if isinstance(vertex_index, ArrayDict):
+            vertex_index = vertex_index.index
+        # Properties resolved by the closure, replaced properties being looked up again
+        properties = tuple(id(self.data.get(name)) for name in self.functor.input_names + [self.functor.name] 
+                           + (self.functor.supplementary_names or []))
+        return (self.choregrapher.structure_version, getattr(vertex_index, "version", None), 
+                len(self.focus) if self.focus is not None else 0, self.functor.numba_speedup, properties)
+
+    def __call__(self):
+        if self.functor.pending is not None:
+            self.functor.install_pending()
+        focus = self.data.get("focus_elements")
+        if focus is not self.focus or self.structure_key() != self.key:
+            self.focus = focus
+            self.key = self.structure_key()
+            profiling = self.choregrapher._profiler is not None
+            self.run = self.functor.compile(self.instance, self.data, self.data_type, timing=self.timing if profiling else None)
+        profiler = self.choregrapher._profiler
+        if profiler is None:
+            self.run()
+        else:
+            profiler.time(self.functor.name, self.run, self.functor.tier, self.elements(), self.timing)
+
+    def elements(self):
+        """Number of elements the functor processes, the whole vertex index for plant scale totals."""
+        if self.functor.total:
+            vertex_index = self.data.get("vertex_index")
+            return len(vertex_index) if vertex_index is not None else 0
+        return len(self.focus) if self.focus is not None else 0
+
+
+class FusedPlan:
+    """
+    Consecutive numba specialized functors of a priority group, run as a single kernel looping once over focus elements 
+    (see specializer.fuse_kernels). If fusion fails, or if a member falls back to an other tier, members are run one by one.
+    """
+    def __init__(self, plans):
+        self.plans = plans
+        self.fused = None
+        self.key = None
+        self.focus = None
+
+    @property
+    def functors(self):
+        return [plan.functor for plan in self.plans]
+
+    def fusable(self):
+        for functor in self.functors:
+            if functor.pending is not None:
+                functor.install_pending()
+        return self.fused is not False and all(functor.numba_speedup and is_elementwise(functor.fun) for functor in self.functors)
+
+    def compile(self):
+        data = self.plans[0].data
+        props = {}
+        for functor in self.functors:
+            for name in functor.input_names + [functor.name] + functor.supplementary_names:
+                props[name] = data[name]
+        scalar_names = [name for name, prop in props.items() if isinstance(prop, ScalarProperty)]
+        kernel, arguments = fuse_kernels([(functor.fun, functor.input_names, [functor.name] + functor.supplementary_names, 
+                                           functor.parameters is not None) 
+                                          for functor in self.functors], 
+                                         scalar_names=scalar_names, nogil=all(functor.fun_nogil for functor in self.functors),
+                                         parallel=all(functor.fun_parallel for functor in self.functors))
+        parameters = tuple(functor.parameters() for functor in self.functors if functor.parameters is not None)
+        focus = data["focus_elements"]
+        vertex_index = data["vertex_index"]
+        if isinstance(focus, FocusElements) and focus.index is getattr(vertex_index, "index", vertex_index):
+            slots = focus.slots
+        else:
+            mask = vertex_index.indices_of(focus)
+            slots = lambda: mask
+        # Outputs are written in place, broadcast defaults being materialized here, inputs are only read
+        outputs = {name for functor in self.functors for name in [functor.name] + functor.supplementary_names}
+        getters = [(lambda p=props[name]: p.value) if name in scalar_names 
+                   else (lambda p=props[name]: p.arr[:p.size]) if name in outputs 
+                   else (lambda p=props[name]: readonly(p.values_array())) 
+                   for name in arguments]
+        
+        def run():
+            mask = slots()
+            kernel(mask, *(get() for get in getters), *parameters)
+        return run
+
+    def structure_key(self, focus):
+        return tuple(plan.structure_key() for plan in self.plans), len(focus) if focus is not None else 0
+
+    def __call__(self):
+        plan = self.plans[0]
+        focus = plan.data.get("focus_elements")
+        if self.fusable():
+            if focus is not self.focus or self.structure_key(focus) != self.key:
+                self.focus, self.key = focus, self.structure_key(focus)
+                try:
+                    self.fused = self.compile()
+                except Exception:
+                    self.fused = False
+            if self.fused:
+                try:
+                    profiler = plan.choregrapher._profiler
+                    if profiler is None:
+                        self.fused()
                     else:
-                        # print(self.name, [arg for arg in self.input_names])
-                        data[self.name].update(
-                                {vid: self.fun(instance, *(data[arg][vid] for arg in self.input_names)) for vid in data["focus_elements"]})
-            # data[self.name].assign_all(self.fun(instance, *(data[arg].values_array() for arg in self.input_names)))
-                
-        elif data_type == "<class 'numpy.ndarray'>":
-            data[self.name] = self.fun(instance, *(data[arg] for arg in self.input_names))
+                        profiler.time("+".join(functor.name for functor in self.functors), self.fused, "fused", 
+                                      len(focus) if focus is not None else 0)
+                    return
+                except Exception:
+                    # Kernels that are not elementwise or types the fused kernel cannot handle
+                    self.fused = False
+        for plan in self.plans:
+            plan()
+
+
+def fuse_plans(plans):
+    """Group consecutive fusable FunctorPlans of a priority group into FusedPlans."""
+    grouped, run = [], []
+    def flush():
+        if len(run) > 1:
+            grouped.append(FusedPlan(list(run)))
+        else:
+            grouped.extend(run)
+        run.clear()
+    for plan in plans:
+        functor = plan.functor
+        # Functors compiled in background are checked when their kernel is installed (see FusedPlan.fusable)
+        if (data_kind(plan.data_type) == "arraydict" and functor.numba_speedup and not functor.total 
+            and not functor.iterating and functor.supplementary_names is not None and is_elementwise(functor.fun)):
+            run.append(plan)
+        else:
+            flush()
+            grouped.append(plan)
+    flush()
+    return grouped
+
+
+def scheduled_functors(group):
+    """Functors of a scheduled group, whether wrapped in plans or not."""
+    for plan in group:
+        if isinstance(plan, FusedPlan):
+            yield from plan.functors
+        else:
+            yield plan.functor if isinstance(plan, FunctorPlan) else plan
+
+
+def kernel_signature(functor, data):
+    """
+    Numba argument types of a functor kernel for the current properties of data, float64 arrays for missing ones.
+    Types are read from dtypes, without any structural access to the properties.
+    """
+    signature = []
+    for name in functor.input_names:
+        prop = data.get(name)
+        if isinstance(prop, ScalarProperty):
+            signature.append(numba.typeof(prop.value))
+        elif isinstance(prop, ArrayDict):
+            # Gathered copies are contiguous 1d arrays
+            signature.append(numba.types.Array(numba.from_dtype(prop.dtype), 1, "C"))
+        else:
+            signature.append(numba.float64[::1])
+    return tuple(signature)
+
+
+def plan_accesses(plan):
+    """
+    Properties read and written by a scheduled plan.
+    :return: (read names, written names, barrier) where barrier tells that accesses are not statically known 
+    (processes iterating on the instance or with supplementary outputs named at run time), so that the plan cannot be reordered.
+    """
+    if isinstance(plan, FusedPlan):
+        reads, writes = set(), set()
+        for member in plan.plans:
+            member_reads, member_writes, _ = plan_accesses(member)
+            reads |= member_reads
+            writes |= member_writes
+        return reads, writes, False
+    functor = plan.functor if isinstance(plan, FunctorPlan) else plan
+    barrier = not isinstance(plan, FunctorPlan) or functor.iterating or functor.supplementary_names is None
+    return set(functor.input_names), {functor.name, *(functor.supplementary_names or ())}, barrier
+
+
+def dependency_waves(plans):
+    """
+    Read/write dependency levels of a priority group : plans of a wave only depend on plans of previous waves,
+    so that they can run concurrently while giving the same result as the serial order.
+    """
+    accesses = [plan_accesses(plan) for plan in plans]
+    levels = []
+    for j, (reads, writes, barrier) in enumerate(accesses):
+        level = 0
+        for i in range(j):
+            previous_reads, previous_writes, previous_barrier = accesses[i]
+            if (barrier or previous_barrier or previous_writes & (reads | writes) or previous_reads & writes):
+                level = max(level, levels[i] + 1)
+        levels.append(level)
+    waves = [[] for _ in range(max(levels) + 1)] if levels else []
+    for plan, level in zip(plans, levels):
+        waves[level].append(plan)
+    return waves
+
+
+def releases_gil(plan):
+    """Whether the plan runs numba kernels only, which can be dispatched to worker threads."""
+    if isinstance(plan, FusedPlan):
+        return plan.fusable() and all(member.functor.fun_nogil for member in plan.plans)
+    return isinstance(plan, FunctorPlan) and plan.functor.numba_speedup and plan.functor.fun_nogil
+
+
+class Profiler:
+    """
+    Records of the functor calls run by the Choregrapher while profiling (see Choregrapher.start_profiling) : 
+    module family, process name, sub time step, priority group, start and wall time, processed elements, execution tier, 
+    time spent gathering and scattering focus elements values, and thread.
+    """
+    columns = ["family", "process", "sub_step", "group", "start", "duration", "elements", "tier", "gather", "scatter", "thread"]
+
+    def __init__(self):
+        self.events = []
+        self.origin = time.perf_counter()
+        # Context of the calls, set by the Choregrapher
+        self.family, self.sub_step, self.group = None, 0, None
+
+    def time(self, process, run, tier, elements, timing=None):
+        """Run and record a call. tier is a string, or a callable giving it after the call (tiers change on fall backs)."""
+        if timing is not None:
+            timing["gather"] = timing["scatter"] = 0.
+        start = time.perf_counter()
+        run()
+        duration = time.perf_counter() - start
+        self.events.append(dict(family=self.family, process=process, sub_step=self.sub_step, group=self.group, 
+                                start=start - self.origin, duration=duration, elements=elements, 
+                                tier=tier() if callable(tier) else tier,
+                                gather=timing["gather"] if timing is not None else 0., 
+                                scatter=timing["scatter"] if timing is not None else 0., 
+                                thread=threading.get_ident()))
+
+    def summary(self) -> list:
+        """Per module family and process totals, sorted by decreasing wall time, with the share of the profiled time."""
+        totals = {}
+        for event in self.events:
+            row = totals.setdefault((event["family"], event["process"]), 
+                                    dict(family=event["family"], process=event["process"], calls=0, duration=0., elements=0, 
+                                         gather=0., scatter=0., tier=event["tier"]))
+            row["calls"] += 1
+            for key in ("duration", "elements", "gather", "scatter"):
+                row[key] += event[key]
+            row["tier"] = event["tier"]
+        overall = sum(row["duration"] for row in totals.values())
+        rows = sorted(totals.values(), key=lambda row: row["duration"], reverse=True)
+        for row in rows:
+            row["mean_duration"] = row["duration"] / row["calls"]
+            row["share"] = row["duration"] / overall if overall > 0 else 0.
+        return rows
+
+    def to_csv(self, path):
+        """Write the summary as CSV."""
+        rows = self.summary()
+        with open(path, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=["family", "process", "calls", "duration", "mean_duration", "share", 
+                                                   "elements", "gather", "scatter", "tier"])
+            writer.writeheader()
+            writer.writerows(rows)
+
+    def to_chrome_trace(self, path):
+        """Write the calls as a Chrome trace / Perfetto JSON timeline, one track per thread and module families as categories."""
+        pid = os.getpid()
+        trace = [dict(name=event["process"], cat=str(event["family"]), ph="X", ts=event["start"] * 1e6, dur=event["duration"] * 1e6,
+                      pid=pid, tid=event["thread"], 
+                      args={key: event[key] for key in ("sub_step", "group", "elements", "tier", "gather", "scatter")})
+                 for event in self.events]
+        with open(path, "w") as f:
+            json.dump(dict(traceEvents=trace, displayTimeUnit="ms"), f)
+
 
 # Executor singleton
 class Singleton:
@@ -144,6 +717,17 @@ class Choregrapher(Singleton):
     """
 
     filter =  {"label": [1, 2], "type":[1, 7, 8, 9, 10, 11, 12]} # see bellow
+    # Consecutive numba specialized functors of a same priority group are run as a single kernel
+    kernel_fusion = False
+    # Above 1, independent numba kernels of a priority group are dispatched to this number of threads
+    parallel_workers = 0
+    # Above 1, kernels are compiled in numba parallel mode and split elements across this number of threads (bounded by NUMBA_NUM_THREADS).
+    # Such kernels are run one at a time, kernel threads taking precedence over parallel_workers
+    kernel_threads = 0
+    # Kernels are compiled in a background thread while functors run on python tiers, instead of before the first step
+    background_compilation = False
+    # Model families whose processes are not specialized by default, for models that do not declare their specialization_mode yet
+    unspecialized_families = ("RootAnatomy", "RootWaterModel", "RootGrowthModelCoupled")
     # filter =  {"label": ["Segment", "Apex"], "type":["Base_of_the_root_system", "Normal_root_after_emergence", "Stopped", "Just_stopped", "Dead", "Just_dead", "Root_nodule"]}
 
     consensus_scheduling = [
@@ -159,6 +743,34 @@ class Choregrapher(Singleton):
         self.scheduled_groups = {}
         self.sub_time_step = {}
         self.data_structure = {"soil":None, "root":None}
+        self.execution_waves = {}
+        self._pool = None
+        self._compiler = None
+        self._profiler = None
+        # Incremented to have functor plans resolved again, for example once properties have been replaced by coupling
+        self.structure_version = 0
+
+    def wait_for_compilation(self):
+        """Block until the kernels submitted for background compilation are compiled."""
+        if self._compiler is not None:
+            self._compiler.shutdown(wait=True)
+            self._compiler = None
+
+    def start_profiling(self):
+        """Record every functor call from now on (see Profiler). Without profiling, calls are not instrumented."""
+        self._profiler = Profiler()
+        # Closures are rebuilt to time gathering and scattering
+        self.invalidate_plans()
+        return self._profiler
+
+    def stop_profiling(self):
+        """Stop recording functor calls, and return the profiler holding the records."""
+        profiler, self._profiler = self._profiler, None
+        self.invalidate_plans()
+        return profiler
+
+    def invalidate_plans(self):
+        self.structure_version += 1
 
 
     def add_time_and_data(self, instance, sub_time_step: int, data: dict, compartment: str = "root"):
@@ -176,23 +788,86 @@ class Choregrapher(Singleton):
         self.sub_time_step[module_family] = sub_time_step
         if self.data_structure[compartment] == None:
             self.data_structure[compartment] = data
-        data_structure_type = str(type(self.data_structure[compartment]["length"])) # TODO : length is common property of all used modules, but might not be generic enough
+        if self.kernel_threads > 1:
+            # Thread count of the calling thread, the one running the model
+            numba.set_num_threads(min(self.kernel_threads, numba.config.NUMBA_NUM_THREADS))
+        data_structure_type = type(self.data_structure[compartment]["length"]) # TODO : length is common property of all used modules, but might not be generic enough
+        # Scalar parameters are constant-folded in kernels, or passed as a tuple argument so that parameter sets share kernels.
+        # Models forbid the specialization of their processes with None, which processes can override (see specialized)
+        mode = self.specialization_mode(instance)
+        parametric = mode == "parametric"
         for k in self.scheduled_groups[module_family].keys():
             for f in range(len(self.scheduled_groups[module_family][k])):
                 functor = self.scheduled_groups[module_family][k][f]
-                if (data_structure_type == "<class 'openalea.metafspm.utils.ArrayDict'>" and not functor.iterating and not functor.total 
-                    and module_family != "RootAnatomy" and module_family != "RootWaterModel" and module_family != "RootGrowthModelCoupled"): # TODO manual exclusions for now
-                    try:
-                        functor.reg = {}
-                        fun, _ = specialize_method_recursive(functor.fun, instance, registry=functor.reg, max_depth=2, print_src=False)
-                        if fun is not None:
-                            functor.fun = fun
-                            functor.numba_speedup = True
-                    except:
-                        pass
-                # It is fine in any situation because this is the functor call, not the function that is passed to partial
-                self.scheduled_groups[module_family][k][f] = partial(functor, *(instance, self.data_structure[compartment], data_structure_type))
+                if functor.specialization is None:
+                    enabled = mode is not None
+                else:
+                    enabled = functor.specialization
+                if not enabled and not functor.iterating:
+                    functor.specialization_failure = "disabled"
+                if issubclass(data_structure_type, ArrayDict) and not functor.iterating and enabled:
+                    if self.background_compilation:
+                        # Functor starts on the python tiers and switches to its kernel once compiled
+                        self.submit_specialization(functor, instance, self.data_structure[compartment], parametric)
+                    else:
+                        self.specialize(functor, instance, self.data_structure[compartment], parametric)
+                # Inputs, outputs and mask are resolved on first call, and again after structural changes
+                self.scheduled_groups[module_family][k][f] = FunctorPlan(functor, instance, self.data_structure[compartment], data_structure_type, self)
+            if self.kernel_fusion:
+                self.scheduled_groups[module_family][k] = fuse_plans(self.scheduled_groups[module_family][k])
+        if self.parallel_workers > 1:
+            self.execution_waves[module_family] = {k: dependency_waves(group) for k, group in self.scheduled_groups[module_family].items()}
+
 
+    def specialization_mode(self, instance):
+        """
+        Specialization mode of the processes of a model instance (see Model.specialization_mode). 
+        Families listed in unspecialized_families are not specialized, unless their model sets specialization_mode itself.
+        """
+        mode = getattr(instance, "specialization_mode", "constant")
+        # The class that defines the mode, the base Model one being only a default
+        owner = next((klass for klass in type(instance).__mro__ if "specialization_mode" in vars(klass)), None)
+        explicit = "specialization_mode" in getattr(instance, "__dict__", {}) or (owner is not None and owner.__module__ != "openalea.metafspm.component")
+        if not explicit and instance.__class__.__name__ in self.unspecialized_families:
+            return None
+        return mode
+
+    def submit_specialization(self, functor, instance, data, parametric=False):
+        """
+        Specialize functor in the background compilation thread, its kernel being eagerly compiled for the argument types of data
+        (float64 arrays for properties not available yet). Types are resolved here, as the data is used by the model meanwhile.
+        """
+        if self._compiler is None:
+            self._compiler = ThreadPoolExecutor(max_workers=1)
+        return self._compiler.submit(self.specialize, functor, instance, data, parametric, True, kernel_signature(functor, data))
+
+    def specialize(self, functor, instance, data, parametric=False, background=False, signature=None):
+        """
+        Specialize functor into a numba kernel. In background (see submit_specialization), the kernel is eagerly compiled 
+        for signature, and handed over to the functor, which installs it on its next call.
+        """
+        parallel = self.kernel_threads > 1
+        nogil = self.parallel_workers > 1 and not parallel
+        start = time.perf_counter()
+        failures = {}
+        try:
+            functor.reg = {}
+            fun, _ = specialize_method_recursive(functor.fun, instance, registry=functor.reg, max_depth=2, print_src=False,
+                                                 nogil=nogil, parametric=parametric, signature=signature, failures=failures,
+                                                 parallel=parallel)
+        except Exception as error:
+            fun = None
+            failures[functor.fun.__name__] = f"{type(error).__name__}: {error}"
+        functor.compile_time = time.perf_counter() - start
+        # Failure of the process itself, else of the first helper that failed
+        functor.specialization_failure = failures.get(functor.fun.__name__, next(iter(failures.values()), None))
+        if fun is not None:
+            parameters = partial(pack_parameters, functor.reg, functor.fun.__name__, instance) if parametric else None
+            if background:
+                # Single attribute assignment, so that the executing thread sees a complete kernel or nothing
+                functor.pending = (fun, parameters, nogil, parallel)
+            else:
+                functor.install(fun, parameters, nogil, parallel)
 
     def add_simulation_time_step(self, simulation_time_step: int):
         """
@@ -293,17 +968,97 @@ class Choregrapher(Singleton):
         self.scheduled_groups[module_family] = {k: self.scheduled_groups[module_family][k] for k in sorted(self.scheduled_groups[module_family].keys())}
 
 
+    def dispatch_stats(self) -> dict:
+        """Kernel dispatch statistics of the scheduled functors, per module family and process name."""
+        return {family: {functor.name: functor.dispatch_stats() for group in groups.values() for functor in scheduled_functors(group)}
+                for family, groups in self.scheduled_groups.items()}
+
+    def specialization_report(self) -> dict:
+        """Execution tier, specialization failure reason and compilation time of the scheduled functors, per module family and process name."""
+        return {family: {functor.name: functor.specialization_report() for group in groups.values() for functor in scheduled_functors(group)}
+                for family, groups in self.scheduled_groups.items()}
+
+    def run_wave(self, wave):
+        """Run independent plans, numba kernels being dispatched to the thread pool while others run in the calling thread."""
+        threaded = [plan for plan in wave if releases_gil(plan)] if len(wave) > 1 else []
+        if len(threaded) == 0:
+            for plan in wave:
+                plan()
+            return
+        if self._pool is None:
+            self._pool = ThreadPoolExecutor(max_workers=self.parallel_workers)
+        # Structural updates shared by the threads are done once beforehand : compaction, gather indices, 
+        # and allocation of broadcast outputs that would otherwise be attached to the vertex index concurrently
+        data = threaded[0].plans[0].data if isinstance(threaded[0], FusedPlan) else threaded[0].data
+        focus = data.get("focus_elements")
+        if isinstance(focus, FocusElements):
+            focus.slots()
+        for plan in threaded:
+            for name in plan_accesses(plan)[1]:
+                prop = data.get(name)
+                if isinstance(prop, BroadcastArrayDict) and not prop.materialized:
+                    prop._materialize()
+                if isinstance(prop, ArrayDict):
+                    prop.index.compact()
+        futures = [self._pool.submit(plan) for plan in threaded]
+        submitted = set(map(id, threaded))
+        for plan in wave:
+            if id(plan) not in submitted:
+                plan()
+        for future in futures:
+            future.result()
+
+    def update_focus_elements(self, data):
+        """
+        Provides data["focus_elements"] as FocusElements for array based data, so that gather indices are shared by functors.
+        On static architectures where no growth model provides it, focus elements are the emerged segments and apices passing the filter.
+        """
+        focus = data.get("focus_elements")
+        struct_mass = data["struct_mass"]
+        if not isinstance(struct_mass, ArrayDict):
+            # Dict based data keeps focus elements as a list, that is requiered on static architectures if no growth model adds it
+            if focus is None:
+                data["focus_elements"] = [vid for vid in struct_mass.keys() if (
+                    struct_mass[vid] > 0 # NOTE : Check if robust, don't we need any calculation for non emerged elements?
+                    and data["label"][vid] in self.filter["label"] 
+                    and data["type"][vid] in self.filter["type"])]
+            return
+        if focus is None:
+            label, vertex_type = data["label"], data["type"]
+            if all(isinstance(prop, ArrayDict) and struct_mass.aligned_with(prop) for prop in (label, vertex_type)):
+                selected = ((struct_mass.values_array() > 0) 
+                            & np.isin(label.values_array(), self.filter["label"])
+                            & np.isin(vertex_type.values_array(), self.filter["type"]))
+                vids = struct_mass.keys_array()[selected]
+            else:
+                vids = [vid for vid in struct_mass.keys() if (
+                    struct_mass[vid] > 0 and label[vid] in self.filter["label"] and vertex_type[vid] in self.filter["type"])]
+            data["focus_elements"] = FocusElements(struct_mass.index, vids)
+        elif not isinstance(focus, FocusElements):
+            # Sequence provided by a growth model
+            data["focus_elements"] = FocusElements(struct_mass.index, focus)
+
     def __call__(self, module_family):
         if self.data_structure['root'] is not None:
-            # This is requiered on static architectures if no growth model adds it
-            if "focus_elements" not in self.data_structure["root"].keys():
-                self.data_structure["root"]["focus_elements"] = [vid for vid in self.data_structure["root"]["struct_mass"].keys() if (
-                    self.data_structure["root"]["struct_mass"][vid] > 0 # NOTE : Check if robust, don't we need any calculation for non emerged elements?
-                    and self.data_structure["root"]["label"][vid] in self.filter["label"] 
-                    and self.data_structure["root"]["type"][vid] in self.filter["type"])]
+            self.update_focus_elements(self.data_structure['root'])
         
+        profiler = self._profiler
+        if profiler is not None:
+            profiler.family = module_family
+
+        if module_family in self.execution_waves:
+            for increment in range(int(self.simulation_time_step/self.sub_time_step[module_family])):
+                for step, waves in self.execution_waves[module_family].items():
+                    if profiler is not None:
+                        profiler.sub_step, profiler.group = increment, step
+                    for wave in waves:
+                        self.run_wave(wave)
+            return
+
         for increment in range(int(self.simulation_time_step/self.sub_time_step[module_family])):
             for step in self.scheduled_groups[module_family].keys():
+                if profiler is not None:
+                    profiler.sub_step, profiler.group = increment, step
                 for functor in self.scheduled_groups[module_family][step]:
                     functor()
 
@@ -315,6 +1070,20 @@ class Choregrapher(Singleton):
 
         
 # Decorators    
+def specialized(enabled: bool = True):
+    """
+    Forces (True) or forbids (False) the numba specialization of a process, whatever the specialization_mode of its model.
+    To be placed under the scheduling decorator :
+        @rate
+        @specialized(False)
+        def _some_rate(self, ...):
+    """
+    def decorator(func):
+        func.specialization = enabled
+        return func
+    return decorator
+
+
 def priorbalance(func):
     def wrapper():
         Choregrapher().add_process(Functor(func, iteraring=True), name="priorbalance")
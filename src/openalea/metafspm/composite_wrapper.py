@@ -1,7 +1,9 @@
 import yaml
+import numpy as np
 from dataclasses import fields
 from importlib import import_module, reload
 from openalea.metafspm.utils import ArrayDict
+from openalea.metafspm.component_factory import Choregrapher
 
 
 def recursive_reload(module):
@@ -14,6 +16,12 @@ def recursive_reload(module):
 
 
 class CompositeModel:
+    """
+    precision_policy, if not empty, is given to the coupled components that do not define their own, see Model.precision_policy,
+    their state variables already stored in the MTG being cast accordingly.
+    """
+
+    precision_policy = {}
 
     def get_documentation(self, filters: dict, models: list):
         """
@@ -99,6 +107,10 @@ class CompositeModel:
         """
 
         self.components = [component for component in args]
+        if self.precision_policy:
+            # Components already stored their state variables when built, those are cast to the policy
+            for component in self.components:
+                component.apply_precision_policy(self.precision_policy)
 
         translator = self.open_or_create_translator(translator_path)
 
@@ -112,14 +124,38 @@ class CompositeModel:
         self.soil_inputs, self.soil_outputs = self.get_component_inputs_outputs(translator=translator, components_names=[c.__class__.__name__ for c in self.components], target_name=soil_name, names_for_others=False)
         
         props = self.data_structures["root"].properties()
+        dtypes = self.property_dtypes()
 
         # Soil did not initialted its properties in the MTG itself since we stopped pickling it, so we do it here
         for name in self.soil_outputs:
-            props[name] = ArrayDict(dict(zip(props["struct_mass"].keys(), [0. for k in range(len(props["struct_mass"]))])), dtype=float)
+            if isinstance(props["struct_mass"], ArrayDict):
+                # Shares the vertex index of other per-vertex properties instead of duplicating it
+                props[name] = ArrayDict(dtype=dtypes.get(name, float), index=props["struct_mass"].index, fill_value=0.)
+            else:
+                props[name] = ArrayDict(dict(zip(props["struct_mass"].keys(), [0. for k in range(len(props["struct_mass"]))])), dtype=float)
 
         for receiver in self.components:
             self.couple_current_with_components_list(receiver=receiver, components=[c.__class__.__name__ for c in self.components] + [soil_name], translator=translator, common_props=props)
+
+        # Coupled properties replaced the ones scheduled functors were resolved against
+        Choregrapher().invalidate_plans()
             
+    def property_dtypes(self):
+        """
+        Storage dtypes of the components' variables resolved from their declarations and precision policies, 
+        else from their float, int or bool annotations, for example to be passed as mtg_to_arraydict(g, dtypes=model.property_dtypes()).
+        """
+        annotated = {float: np.float64, "float": np.float64, int: np.int64, "int": np.int64, bool: np.bool_, "bool": np.bool_}
+        dtypes = {}
+        for component in self.components:
+            for f in fields(component):
+                dtype = component.dtype_of(f.name)
+                if dtype is None and f.type in annotated:
+                    dtype = np.dtype(annotated[f.type])
+                if dtype is not None:
+                    dtypes.setdefault(f.name, dtype)
+        return dtypes
+
     def open_or_create_translator(self, translator_path):
         try:
             with open(translator_path + "/coupling_translator.yaml", "r") as f:
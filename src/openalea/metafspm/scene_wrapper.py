@@ -16,9 +16,11 @@ def play_Orchestra(scene_name, output_folder,
                  logger_class = None, log_settings: dict = {}, heavy_log_period: int = 24,
                  n_iterations = 2500, time_step=3600, scene_xrange=1, scene_yrange=1, sowing_density=250, row_spacing=0.15, max_depth=1.3,
                  voxel_widht=0.01, voxel_height=0.01,
-                 record_performance=False):
+                 record_performance=False, threads_per_plant: int = 1):
     """
-    Orchestrator function launching in parallel plant models and then environment models
+    Orchestrator function launching in parallel plant models and then environment models.
+    With threads_per_plant above 1, each plant process is pinned to that number of cpus, 
+    which its numba kernels split elements across (see Choregrapher.kernel_threads).
     ---
     TODO : Scene orientation regarding an angle relative to North
     
@@ -47,7 +49,7 @@ def play_Orchestra(scene_name, output_folder,
                                                                 sowing_depth=[0.025], row_spacing=row_spacing, plant_models=plant_models,
                                                                 plant_scenarios=plant_scenarios, plant_model_frequency=[1.])
     
-    cpu_assignments = plan_affinity(len(planting_sequence), 1) # TODO : only 1 cpu per plant as for now, see if we need to adapt this if we start leveraging intense vectorization with numba
+    cpu_assignments = plan_affinity(len(planting_sequence), threads_per_plant)
     
     # Queues to perform synchronization and data sharing of the processes
     queues_soil_to_plants = {pid: mp.Queue() for pid in planting_sequence.keys()}
@@ -185,6 +187,11 @@ def plant_worker(queues_soil_to_plants, queue_plants_to_soil, queues_light_to_pl
     
     # Pin to a specific set of cpus to avoid concurrency
     psutil.Process().cpu_affinity(cpu_ids)
+    if len(cpu_ids) > 1:
+        # Set before the model instance is created, as kernels are specialized at initialization
+        os.environ["OMP_NUM_THREADS"] = str(len(cpu_ids))
+        from openalea.metafspm.component_factory import Choregrapher
+        Choregrapher().kernel_threads = len(cpu_ids)
     
     # Each process creates its local instance (which includes the unique properties).
     instance = plant_model(queues_soil_to_plants=queues_soil_to_plants, queue_plants_to_soil=queue_plants_to_soil, 
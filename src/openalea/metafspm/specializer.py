@@ -1,6 +1,48 @@
-import ast, inspect, textwrap, linecache
+import ast, inspect, textwrap, linecache, os, re, sys, tempfile, warnings, weakref, functools, contextlib, importlib.util
 import numpy as np
-from numba import njit
+import numba
+from numba import njit, prange
+
+
+# Directory of the persistent kernel cache, disabled if None. It can be shared by concurrent worker processes.
+kernel_cache_dir = os.environ.get("METAFSPM_KERNEL_CACHE")
+
+# Specializations shared in the process by all functors, model families and plants, 
+# keyed by (method, inlined constants, injected arrays identities, helper kernels identities, nogil, parallel, signature).
+# Methods that could not be specialized map to the reason of the failure.
+_specializations = {}
+
+@contextlib.contextmanager
+def parallel_warnings_ignored():
+    """Compilations without numba warnings about parallel kernels of processes with nothing to parallelize, which just run serially."""
+    with warnings.catch_warnings():
+        warnings.filterwarnings("ignore", message=r"\s*The keyword argument .parallel=True.", category=numba.NumbaPerformanceWarning)
+        yield
+
+def without_parallel_warnings(kernel):
+    """
+    Parallel kernel whose first call, compiling it for the argument types, emits no numba warnings about parallelization 
+    (see parallel_warnings_ignored). Later calls go straight to the dispatcher, leaving warning filters untouched.
+    """
+    compiled = False
+    def run(*args):
+        nonlocal compiled
+        if compiled:
+            return kernel(*args)
+        with parallel_warnings_ignored():
+            result = kernel(*args)
+        compiled = True
+        return result
+    return run
+
+def clear_specializations():
+    """Forget kernels shared in the process, for example after parameters arrays have been edited in place."""
+    _specializations.clear()
+
+def set_kernel_cache_dir(path):
+    """Enable the persistent cache of specialized kernels in the directory path (None to disable it)."""
+    global kernel_cache_dir
+    kernel_cache_dir = path
 
 
 # ------------------- AST helpers -------------------
@@ -31,6 +73,105 @@ def _infer_attrs_to_inline(fdef):
                 mutated.add(a.attr)
     return reads - mutated
 
+def writes_instance_attributes(func) -> bool:
+    """Whether func assigns self.<attr> or self.<attr>[...], in which case it relies on being called once per element."""
+    try:
+        tree = ast.parse(textwrap.dedent(inspect.getsource(func)))
+    except (OSError, TypeError, SyntaxError):
+        return True
+    fdef = next(n for n in tree.body if isinstance(n, (ast.FunctionDef, ast.AsyncFunctionDef)))
+    for n in ast.walk(fdef):
+        target = n.value if isinstance(n, ast.Subscript) else n
+        if (isinstance(n, (ast.Attribute, ast.Subscript)) and isinstance(n.ctx, (ast.Store, ast.Del))
+            and isinstance(target, ast.Attribute) and isinstance(target.value, ast.Name) and target.value.id == 'self'):
+            return True
+    return False
+
+class ConstantItems(ast.NodeTransformer):
+    """
+    Rewrite self.<attr>[<constant>] reads of dict attributes as self.<attr>[<constant>] attributes, 
+    so that the items are inlined or packed as parameters like any scalar or array attribute (see _attribute).
+    """
+    def __init__(self, instance):
+        self.instance = instance
+
+    def visit_Subscript(self, node):
+        self.generic_visit(node)
+        target = node.value
+        if (isinstance(node.ctx, ast.Load) and isinstance(node.slice, ast.Constant) and isinstance(target, ast.Attribute)
+            and isinstance(target.value, ast.Name) and target.value.id == 'self'):
+            try:
+                container = _attribute(self.instance, target.attr)
+            except (AttributeError, KeyError, IndexError, TypeError, ValueError, SyntaxError):
+                return node
+            if isinstance(container, dict) and node.slice.value in container:
+                return ast.copy_location(ast.Attribute(value=target.value, attr=f"{target.attr}[{node.slice.value!r}]", ctx=ast.Load()), node)
+        return node
+
+def _attribute(instance, attr):
+    """Value of self.<attr>, attr being possibly followed by constant subscripts of dict attributes (see ConstantItems)."""
+    if not attr.endswith("]"):
+        return getattr(instance, attr)
+    node = ast.parse(f"self.{attr}", mode="eval").body
+    keys = []
+    while isinstance(node, ast.Subscript):
+        keys.append(ast.literal_eval(node.slice))
+        node = node.value
+    value = getattr(instance, node.attr)
+    for key in reversed(keys):
+        value = value[key]
+    return value
+
+def _positional_call(node, function):
+    """
+    Arguments of a call to function as a positional list, keyword arguments being placed and missing ones given their defaults.
+    Returns None if the call or the defaults cannot be expressed this way.
+    """
+    if any(isinstance(arg, ast.Starred) for arg in node.args) or any(kw.arg is None for kw in node.keywords):
+        return None
+    signature = inspect.signature(function)
+    if any(p.kind in (p.VAR_POSITIONAL, p.VAR_KEYWORD) for p in signature.parameters.values()):
+        return None
+    try:
+        bound = signature.bind(None, *node.args, **{kw.arg: kw.value for kw in node.keywords})
+    except TypeError:
+        return None
+    bound.apply_defaults()
+    args = []
+    for value in list(bound.arguments.values())[1:]:
+        if not isinstance(value, ast.AST):
+            if value is not None and _parameter_value(value) is None:
+                return None
+            value = ast.Constant(value if value is None else _parameter_value(value))
+        args.append(value)
+    return args
+
+def supplementary_output_names(func):
+    """
+    Names of the supplementary outputs of a process returning (value, "name", value, ...), if every return statement
+    gives them as the same string constants. Returns None if they are only known at run time.
+    """
+    try:
+        tree = ast.parse(textwrap.dedent(inspect.getsource(func)))
+    except (OSError, TypeError, SyntaxError):
+        return None
+    fdef = next(n for n in tree.body if isinstance(n, (ast.FunctionDef, ast.AsyncFunctionDef)))
+    names = None
+    for n in ast.walk(fdef):
+        if isinstance(n, ast.Return):
+            if not isinstance(n.value, ast.Tuple) or len(n.value.elts) % 2 == 0:
+                return None
+            labels = n.value.elts[1::2]
+            if not all(isinstance(label, ast.Constant) and isinstance(label.value, str) for label in labels):
+                return None
+            if names is not None and names != [label.value for label in labels]:
+                return None
+            names = [label.value for label in labels]
+    return names
+
+def _parameter(i):
+    return ast.Subscript(value=ast.Name(id='__P', ctx=ast.Load()), slice=ast.Constant(i), ctx=ast.Load())
+
 def _find_self_callees(fdef):
     names = set()
     for n in ast.walk(fdef):
@@ -39,10 +180,60 @@ def _find_self_callees(fdef):
                 names.add(n.func.attr)
     return names
 
+def _array_global(attr):
+    """Global name under which an array attribute is injected in a specialized kernel."""
+    return "__C_" + re.sub(r"\W", "_", attr)
+
 def _stable_hash(text: str) -> str:
     import hashlib
     return hashlib.sha1(text.encode('utf-8')).hexdigest()[:16]
 
+def _cache_key(gen_src, global_arrays, callee_keys, nogil, parallel=False):
+    """
+    Content address of a specialized kernel : generated source (with its inlined constants), injected arrays contents, 
+    keys of the helpers it calls, and versions of the toolchain. Argument types are handled by the numba cache index of the file.
+    """
+    import hashlib
+    digest = hashlib.sha1()
+    for part in (gen_src, repr(sorted(callee_keys.items())), str(nogil), str(parallel), numba.__version__, np.__version__, sys.version):
+        digest.update(part.encode('utf-8'))
+    for name, arr in sorted(global_arrays.items()):
+        digest.update(f"{name}:{arr.dtype.str}:{arr.shape}".encode('utf-8'))
+        digest.update(np.ascontiguousarray(arr).tobytes())
+    return digest.hexdigest()[:24]
+
+_MODULE_ATTRIBUTES = {'__name__', '__file__', '__spec__', '__loader__', '__package__', '__builtins__', '__cached__', '__doc__'}
+
+def _load_cached_source(name, gen_src, glb, key, cache_dir):
+    """
+    Write the generated source once as a content addressed module of cache_dir and import it, so that numba can cache 
+    its compiled versions next to it. Files are published atomically by hard linking and never rewritten, which keeps numba cache stamps valid
+    when worker processes share the directory.
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    module_name = f"{name}_{key}"
+    path = os.path.join(cache_dir, module_name + ".py")
+    if not os.path.exists(path):
+        fd, tmp = tempfile.mkstemp(dir=cache_dir, suffix=".tmp")
+        with os.fdopen(fd, "w") as f:
+            f.write(gen_src + "\n")
+        try:
+            # Linking fails instead of replacing a file another process published in between, its content being identical
+            os.link(tmp, path)
+        except FileExistsError:
+            pass
+        finally:
+            os.remove(tmp)
+    # Registered as a module since numba resolves the environment of cached kernels by module name
+    module_name = f"metafspm_kernel{module_name}"
+    if module_name not in sys.modules:
+        spec = importlib.util.spec_from_file_location(module_name, path)
+        module = importlib.util.module_from_spec(spec)
+        module.__dict__.update({k: v for k, v in glb.items() if k not in _MODULE_ATTRIBUTES})
+        sys.modules[module_name] = module
+        spec.loader.exec_module(module)
+    return getattr(sys.modules[module_name], name)
+
 class StripDecorators(ast.NodeTransformer):
     """Remove all decorators from functions/classes in the parsed tree."""
     def visit_FunctionDef(self, node):
@@ -60,15 +251,72 @@ class StripDecorators(ast.NodeTransformer):
 
 # ------------------- Recursive specializer -------------------
 
-def specialize_method_recursive(method, instance, max_depth=2, registry=None, print_src=False, debug=False):
+def _parameter_value(val):
+    """
+    Value of a self.<attr> that can be inlined or packed as a parameter, None if unsupported.
+    Numeric lists and dicts indexed by 0..n-1 are passed as tuples, made homogeneous so that they can be indexed by variables.
+    """
+    numbers = (bool, int, float, np.bool_, np.integer, np.floating)
+    if isinstance(val, numbers):
+        return bool(val) if isinstance(val, np.bool_) \
+               else int(val) if isinstance(val, np.integer) \
+               else float(val) if isinstance(val, np.floating) \
+               else val
+    if isinstance(val, dict) and len(val) > 0 and list(val.keys()) == list(range(len(val))):
+        val = list(val.values())
+    if isinstance(val, (tuple, list)) and all(isinstance(x, numbers) for x in val):
+        values = tuple(_parameter_value(x) for x in val)
+        if isinstance(val, list) or len(set(type(x) for x in values)) > 1:
+            if any(isinstance(x, float) for x in values):
+                values = tuple(float(x) for x in values)
+        return values
+    return None
+
+def pack_parameters(registry, name, instance):
+    """
+    Parameters tuple of a kernel specialized in parametric mode, from the current attributes of instance.
+    Helpers parameters are nested tuples, in the layout recorded at specialization.
+    """
+    values = []
+    for kind, attr in registry[name]['layout']:
+        if kind == 'helper':
+            values.append(pack_parameters(registry, attr, instance))
+        elif kind == 'array':
+            values.append(_attribute(instance, attr))
+        else:
+            values.append(_parameter_value(_attribute(instance, attr)))
+    return tuple(values)
+
+def _failure_reason(error, unsupported=()):
+    """Short description of why a specialized method could not be compiled."""
+    if unsupported:
+        return "unsupported attribute type: " + ", ".join(f"self.{attr} ({kind})" for attr, kind in unsupported)
+    if isinstance(error, numba.core.errors.TypingError):
+        lines = [line.strip() for line in str(error).splitlines() if line.strip()]
+        return "numba typing error: " + (lines[1] if len(lines) > 1 else lines[0] if lines else "")
+    return f"{type(error).__name__}: {error}"
+
+def specialize_method_recursive(method, instance, max_depth=2, registry=None, print_src=False, debug=False, nogil=False, parametric=False,
+                                signature=None, failures=None, parallel=False):
     """
     Recursively specialize `method` and its nested self.method(...) callees.
+    With nogil=True, kernels release the GIL so that independent ones can run concurrently in threads.
+    With parallel=True, array expressions of kernels are split across numba threads (see numba.set_num_threads).
+    By default, scalar self.<attr> are constant-folded in the generated source. With parametric=True, they are rather read 
+    in a tuple passed as last argument (see pack_parameters), so that one compiled kernel serves every parameter set.
+    Kernels are checked by a trial call with integer arguments, unless the numba argument types of method are given as signature, 
+    in which case method is eagerly compiled for them (helpers being typed through it).
+    Reasons of failed specializations are reported in the failures dict if given, by method name.
     Returns (numba_dispatcher, registry).
     """
     if registry is None:
         registry = {}
+    if failures is None:
+        failures = {}
     cls = instance.__class__
     visiting = set()
+    # Kernels eagerly compiled for a signature are only shared with requests for the same argument types
+    compiled_for = None if signature is None else tuple(signature)
 
     def _specialize_by_name(name: str, depth: int):
         if name in registry:
@@ -79,11 +327,16 @@ def specialize_method_recursive(method, instance, max_depth=2, registry=None, pr
             if debug: print(f"Max recursion depth exceeded while specializing '{name}'")
 
         py_method = getattr(cls, name)  # unbound function
-        src = textwrap.dedent(inspect.getsource(py_method))
+        try:
+            src = textwrap.dedent(inspect.getsource(py_method))
+        except (OSError, TypeError) as error:
+            failures[name] = f"source not available: {error}"
+            return
         tree = ast.parse(src)
 
-        # Remove decorators
+        # Remove decorators, and read constant items of dict attributes as attributes
         StripDecorators().visit(tree)
+        ConstantItems(instance).visit(tree)
         ast.fix_missing_locations(tree)
 
         fdef = next(n for n in tree.body if isinstance(n, ast.FunctionDef))
@@ -97,46 +350,80 @@ def specialize_method_recursive(method, instance, max_depth=2, registry=None, pr
         visiting.remove(name)
 
         # 2) inline self.<attr>
-        const_map, global_arrays = {}, {}
+        const_map, global_arrays, unsupported = {}, {}, []
         for attr in sorted(_infer_attrs_to_inline(fdef)):
-            val = getattr(instance, attr)
-            if isinstance(val, (bool, int, float, np.bool_, np.integer, np.floating)):
-                const_map[attr] = bool(val) if isinstance(val, np.bool_) \
-                                  else int(val) if isinstance(val, np.integer) \
-                                  else float(val) if isinstance(val, np.floating) \
-                                  else val
-            elif isinstance(val, np.ndarray):
+            val = _attribute(instance, attr)
+            if isinstance(val, np.ndarray):
                 global_arrays[attr] = val  # inject as read-only global
-            elif isinstance(val, tuple) and all(isinstance(x, (bool, int, float, np.bool_, np.integer, np.floating)) for x in val):
-                const_map[attr] = tuple(bool(x) if isinstance(x, np.bool_) else int(x) if isinstance(x, np.integer) else float(x) if isinstance(x, np.floating) else x
-                                        for x in val)
+            elif _parameter_value(val) is not None:
+                const_map[attr] = _parameter_value(val)
+            elif not callable(val):
+                unsupported.append((attr, type(val).__name__))
 
         sym_for = {callee: f"__HELP_{callee}" for callee in callees}
+        helpers = [callee for callee in sorted(callees) if callee in registry]
+
+        # Parametric mode : position of each parameter in the __P tuple argument
+        layout = ([('scalar', attr) for attr in sorted(const_map)] + [('array', attr) for attr in sorted(global_arrays)] 
+                  + [('helper', callee) for callee in helpers]) if parametric else []
+        position = {attr: i for i, (kind, attr) in enumerate(layout) if kind != 'helper'}
+        helper_position = {attr: i for i, (kind, attr) in enumerate(layout) if kind == 'helper'}
+
+        # Reuse the kernel if the same method was already specialized with the same constants, arrays and helpers in the process
+        if parametric:
+            # Only parameter types matter
+            shared_key = (py_method, 'parametric', repr(sorted((attr, type(v).__name__) for attr, v in const_map.items())),
+                          tuple(sorted((attr, arr.dtype.str, arr.ndim) for attr, arr in global_arrays.items())),
+                          tuple((callee, id(registry[callee]['jit'])) for callee in helpers), nogil, parallel, compiled_for)
+        else:
+            shared_key = (py_method, repr(sorted(const_map.items())), 
+                          tuple(sorted((attr, id(arr)) for attr, arr in global_arrays.items())),
+                          tuple((callee, id(registry[callee]['jit'])) for callee in helpers), nogil, parallel, compiled_for)
+        if shared_key in _specializations:
+            if isinstance(_specializations[shared_key], dict):
+                registry[name] = _specializations[shared_key]
+            else:
+                failures[name] = _specializations[shared_key]
+            return
 
         class Rewriter(ast.NodeTransformer):
             def visit_Attribute(self, node):
                 self.generic_visit(node)
                 if isinstance(node.value, ast.Name) and node.value.id == 'self':
                     nm = node.attr
+                    if nm in position:
+                        return ast.copy_location(_parameter(position[nm]), node)
                     if nm in const_map:
                         return ast.copy_location(ast.Constant(const_map[nm]), node)
                     if nm in global_arrays:
-                        return ast.copy_location(ast.Name(id=f'__C_{nm}', ctx=ast.Load()), node)
+                        return ast.copy_location(ast.Name(id=_array_global(nm), ctx=ast.Load()), node)
                 return node
             def visit_Call(self, node):
                 self.generic_visit(node)
                 f = node.func
                 if (isinstance(f, ast.Attribute) and isinstance(f.value, ast.Name)
                     and f.value.id == 'self' and f.attr in sym_for):
+                    # Helpers are called with positional arguments only, defaults being dropped from their definitions
+                    args = _positional_call(node, getattr(cls, f.attr))
+                    if args is not None:
+                        node.args, node.keywords = args, []
+                    if f.attr in helper_position:
+                        node.args.append(_parameter(helper_position[f.attr]))
                     node.func = ast.copy_location(ast.Name(id=sym_for[f.attr], ctx=ast.Load()), f)
                 return node
 
         Rewriter().visit(tree)
         ast.fix_missing_locations(tree)
 
-        # 3) drop 'self'
+        # 3) drop 'self', and defaults as specialized callers pass every argument
         if fdef.args.args and fdef.args.args[0].arg == 'self':
             fdef.args.args = fdef.args.args[1:]
+        fdef.args.args += fdef.args.kwonlyargs
+        fdef.args.kwonlyargs, fdef.args.kw_defaults, fdef.args.defaults = [], [], []
+        n_args = len(fdef.args.args)
+        if parametric:
+            fdef.args.args.append(ast.arg(arg='__P'))
+            ast.fix_missing_locations(tree)
         fdef.name = name
 
         # 4) pretty source (optional)
@@ -152,29 +439,47 @@ def specialize_method_recursive(method, instance, max_depth=2, registry=None, pr
         glb = dict(py_method.__globals__)
         glb.setdefault('np', np)
         for an, arr in global_arrays.items():
-            glb[f"__C_{an}"] = arr
+            if not parametric:
+                glb[_array_global(an)] = arr
         for callee in callees:
             if callee in registry:
                 glb[sym_for[callee]] = registry[callee]['jit']  # compiled helper
 
-        # 6) exec + JIT
+        # 6) exec + JIT, through the persistent cache if enabled
+        key = _cache_key(gen_src, {} if parametric else global_arrays, {callee: registry[callee]['key'] for callee in helpers}, nogil, parallel)
         try:
-            ns = {}
-            code = compile(tree, fake_fn, "exec")
-            exec(code, glb, ns)
-            py_func = ns[name]
-            jitted = njit(py_func, cache=False)
+            if kernel_cache_dir is not None:
+                py_func = _load_cached_source(name, gen_src, glb, key, kernel_cache_dir)
+                jitted = njit(py_func, cache=True, nogil=nogil, parallel=parallel)
+            else:
+                ns = {}
+                code = compile(tree, fake_fn, "exec")
+                exec(code, glb, ns)
+                py_func = ns[name]
+                jitted = njit(py_func, cache=False, nogil=nogil, parallel=parallel)
 
             # try compile once (ignore arg mismatch)
             try:
-                _ = jitted(*(1 for _ in range(len(fdef.args.args))))
-                registry[name] = {'jit': jitted, 'py': py_func, 'src': gen_src}
+                entry = {'jit': jitted, 'py': py_func, 'src': gen_src, 'key': key, 'layout': layout, 'parametric': parametric,
+                         # Arrays are referenced by the entry so that their identities are not reused
+                         'arrays': global_arrays}
+                registry[name] = entry
+                params = (pack_parameters(registry, name, instance),) if parametric else ()
+                with parallel_warnings_ignored() if parallel else contextlib.nullcontext():
+                    if signature is None:
+                        _ = jitted(*(1 for _ in range(n_args)), *params)
+                    elif name == entry_name:
+                        if len(signature) != n_args:
+                            raise TypeError(f"arity mismatch: {name} takes {n_args} arguments, {len(signature)} types given")
+                        jitted.compile(tuple(signature) + tuple(numba.typeof(p) for p in params))
+                _specializations[shared_key] = registry[name]
 
-            except Exception:
-                pass
+            except Exception as error:
+                registry.pop(name, None)
+                _specializations[shared_key] = failures[name] = _failure_reason(error, unsupported)
 
-        except Exception:
-            pass
+        except Exception as error:
+            _specializations[shared_key] = failures[name] = _failure_reason(error, unsupported)
 
     entry_name = method.__name__ if inspect.ismethod(method) else method.__name__
     _specialize_by_name(entry_name, max_depth)
@@ -183,4 +488,439 @@ def specialize_method_recursive(method, instance, max_depth=2, registry=None, pr
     if entry_name in registry:
         return registry[entry_name]['jit'], registry
     else:
-        return None, None
\ No newline at end of file
+        return None, None
+
+# ------------------- NumPy vectorizer -------------------
+
+class NotVectorizable(Exception):
+    pass
+
+_MATH_UFUNCS = {"exp": "exp", "expm1": "expm1", "log": "log", "log10": "log10", "log2": "log2", "log1p": "log1p",
+                "sqrt": "sqrt", "pow": "power", "hypot": "hypot", "fabs": "abs", "floor": "floor", "ceil": "ceil",
+                "trunc": "trunc", "copysign": "copysign", "sin": "sin", "cos": "cos", "tan": "tan", "asin": "arcsin",
+                "acos": "arccos", "atan": "arctan", "atan2": "arctan2", "sinh": "sinh", "cosh": "cosh", "tanh": "tanh",
+                "isnan": "isnan", "isinf": "isinf", "isfinite": "isfinite"}
+_BUILTIN_UFUNCS = {"min": "minimum", "max": "maximum", "abs": "abs"}
+
+def _np_call(fun, *args):
+    return ast.Call(func=ast.Attribute(value=ast.Name(id='__np', ctx=ast.Load()), attr=fun, ctx=ast.Load()),
+                    args=list(args), keywords=[])
+
+def _reduce_pairwise(fun, args):
+    out = args[0]
+    for a in args[1:]:
+        out = _np_call(fun, out, a)
+    return out
+
+class _ArrayExpressions(ast.NodeTransformer):
+    """Rewrite scalar expressions into their element-wise numpy counterparts."""
+    def __init__(self, helpers):
+        self.helpers = helpers
+        self.branches = 0
+        # and/or only evaluate to booleans in conditions, elsewhere they evaluate to one of their operands
+        self.conditions = set()
+
+    def visit(self, node):
+        for n in ast.walk(node):
+            if isinstance(n, (ast.If, ast.IfExp)):
+                self._mark_condition(n.test)
+        return super().visit(node)
+
+    def _mark_condition(self, node):
+        if isinstance(node, ast.BoolOp):
+            self.conditions.add(id(node))
+            for value in node.values:
+                self._mark_condition(value)
+        elif isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.Not):
+            self._mark_condition(node.operand)
+
+    def visit_Call(self, node):
+        self.generic_visit(node)
+        f = node.func
+        if node.keywords:
+            return node
+        if isinstance(f, ast.Attribute) and isinstance(f.value, ast.Name):
+            if f.value.id == 'math' and f.attr in _MATH_UFUNCS:
+                return ast.copy_location(_np_call(_MATH_UFUNCS[f.attr], *node.args), node)
+            if f.value.id == 'self' and f.attr in self.helpers:
+                return ast.copy_location(ast.Call(func=ast.Name(id=self.helpers[f.attr], ctx=ast.Load()),
+                                                  args=[ast.Name(id='self', ctx=ast.Load())] + node.args, keywords=[]), node)
+        if isinstance(f, ast.Name) and f.id in _BUILTIN_UFUNCS:
+            if f.id == 'abs' and len(node.args) == 1:
+                return ast.copy_location(_np_call('abs', node.args[0]), node)
+            if f.id != 'abs' and len(node.args) >= 2:
+                return ast.copy_location(_reduce_pairwise(_BUILTIN_UFUNCS[f.id], node.args), node)
+        return node
+
+    def visit_IfExp(self, node):
+        self.generic_visit(node)
+        self.branches += 1
+        # Both branches are evaluated for all elements, floating point errors being ignored there
+        body, orelse = (ast.Call(func=ast.Name(id='__ignoring_errors', ctx=ast.Load()), 
+                                 args=[ast.Lambda(args=ast.arguments(posonlyargs=[], args=[], kwonlyargs=[], kw_defaults=[], defaults=[]), 
+                                                  body=branch)], keywords=[]) 
+                        for branch in (node.body, node.orelse))
+        return ast.copy_location(_np_call('where', node.test, body, orelse), node)
+
+    def visit_BoolOp(self, node):
+        if id(node) not in self.conditions:
+            raise NotVectorizable("and/or used as a value")
+        self.generic_visit(node)
+        fun = 'logical_and' if isinstance(node.op, ast.And) else 'logical_or'
+        return ast.copy_location(_reduce_pairwise(fun, node.values), node)
+
+    def visit_UnaryOp(self, node):
+        self.generic_visit(node)
+        if isinstance(node.op, ast.Not):
+            return ast.copy_location(_np_call('logical_not', node.operand), node)
+        return node
+
+    def visit_Compare(self, node):
+        self.generic_visit(node)
+        if len(node.ops) == 1:
+            return node
+        # a < b < c -> (a < b) & (b < c)
+        operands = [node.left] + node.comparators
+        pairs = [ast.Compare(left=operands[k], ops=[op], comparators=[operands[k + 1]]) for k, op in enumerate(node.ops)]
+        return ast.copy_location(_reduce_pairwise('logical_and', pairs), node)
+
+def _contains_return(stmts):
+    return any(isinstance(n, ast.Return) for st in stmts for n in ast.walk(st))
+
+def _normalize_returns(stmts, n_returned):
+    """
+    Turn returns into assignments of __ret<k> variables, statements following a conditional return being moved in both branches.
+    :return: the new statements, and whether all paths return.
+    """
+    out = []
+    for i, st in enumerate(stmts):
+        if isinstance(st, ast.Return):
+            values = st.value.elts if isinstance(st.value, ast.Tuple) else [st.value]
+            if st.value is None or len(values) != n_returned:
+                raise NotVectorizable("inconsistent returns")
+            out.append(ast.Assign(targets=[ast.Tuple(elts=[ast.Name(id=f'__ret{k}', ctx=ast.Store()) for k in range(n_returned)],
+                                                     ctx=ast.Store())],
+                                  value=ast.Tuple(elts=values, ctx=ast.Load())))
+            return out, True
+        if isinstance(st, ast.If) and _contains_return([st]):
+            rest = stmts[i + 1:]
+            body, body_returns = _normalize_returns(st.body + rest, n_returned)
+            orelse, orelse_returns = _normalize_returns(st.orelse + rest, n_returned)
+            out.append(ast.If(test=st.test, body=body or [ast.Pass()], orelse=orelse))
+            return out, body_returns and orelse_returns
+        if _contains_return([st]):
+            raise NotVectorizable("return inside a loop or context")
+        out.append(st)
+    return out, False
+
+class _IfConverter:
+    """
+    If-conversion of a straight-line function body : every branch is evaluated and variables assigned in branches
+    are merged with np.where. Variables are renamed in static single assignment form so that branches do not interfere.
+    """
+    def __init__(self):
+        self.count = 0
+        self.branches = 0
+
+    def fresh(self, base):
+        self.count += 1
+        return f"{base}__v{self.count}"
+
+    def rename(self, expr, env):
+        class Renamer(ast.NodeTransformer):
+            def visit_Name(self, node):
+                if isinstance(node.ctx, ast.Load) and node.id in env:
+                    return ast.copy_location(_copy(env[node.id]), node)
+                return node
+        return Renamer().visit(_copy(expr))
+
+    def bind(self, name, value, out, env):
+        if isinstance(value, (ast.Constant, ast.Name)):
+            env[name] = value
+        else:
+            new = self.fresh(name)
+            out.append(ast.Assign(targets=[ast.Name(id=new, ctx=ast.Store())], value=value))
+            env[name] = ast.Name(id=new, ctx=ast.Load())
+
+    def block(self, stmts, env):
+        out = []
+        for st in stmts:
+            if isinstance(st, (ast.Assign, ast.AnnAssign)) and st.value is not None:
+                targets = st.targets if isinstance(st, ast.Assign) else [st.target]
+                if len(targets) != 1:
+                    raise NotVectorizable("chained assignment")
+                target, value = targets[0], self.rename(st.value, env)
+                if isinstance(target, ast.Name):
+                    self.bind(target.id, value, out, env)
+                elif (isinstance(target, ast.Tuple) and isinstance(value, ast.Tuple) and len(target.elts) == len(value.elts)
+                      and all(isinstance(t, ast.Name) for t in target.elts)):
+                    for t, v in zip(target.elts, value.elts):
+                        self.bind(t.id, v, out, env)
+                else:
+                    raise NotVectorizable("unsupported assignment target")
+            elif isinstance(st, ast.AugAssign) and isinstance(st.target, ast.Name):
+                current = env.get(st.target.id, ast.Name(id=st.target.id, ctx=ast.Load()))
+                self.bind(st.target.id, ast.BinOp(left=_copy(current), op=st.op, right=self.rename(st.value, env)), out, env)
+            elif isinstance(st, ast.Pass) or (isinstance(st, ast.Expr) and isinstance(st.value, ast.Constant)):
+                continue
+            elif isinstance(st, ast.If):
+                self.branches += 1
+                cond = self.fresh("__cond")
+                out.append(ast.Assign(targets=[ast.Name(id=cond, ctx=ast.Store())], value=self.rename(st.test, env)))
+                env_true, env_false = dict(env), dict(env)
+                # Both branches are evaluated for all elements, floating point errors being ignored there
+                for branch in (self.block(st.body, env_true), self.block(st.orelse, env_false)):
+                    if branch:
+                        out.append(_ignoring_errors(branch))
+                for var in sorted(set(env_true) | set(env_false)):
+                    if_true, if_false = env_true.get(var), env_false.get(var)
+                    if if_true is None or if_false is None:
+                        # Only defined in one branch, only meaningful for the elements of that branch
+                        env[var] = if_true if if_false is None else if_false
+                    elif ast.dump(if_true) == ast.dump(if_false):
+                        env[var] = if_true
+                    else:
+                        self.bind(var, _np_call('where', ast.Name(id=cond, ctx=ast.Load()), _copy(if_true), _copy(if_false)), out, env)
+            else:
+                raise NotVectorizable(f"unsupported statement {type(st).__name__}")
+        return out
+
+def _ignoring_errors(body):
+    """with __np.errstate(all="ignore"): body"""
+    return ast.With(items=[ast.withitem(context_expr=ast.Call(func=ast.Attribute(value=ast.Name(id='__np', ctx=ast.Load()),
+                                                                                 attr='errstate', ctx=ast.Load()),
+                                                              args=[], keywords=[ast.keyword(arg='all', value=ast.Constant('ignore'))]))],
+                    body=body)
+
+def _call_ignoring_errors(fun):
+    with np.errstate(all="ignore"):
+        return fun()
+
+def _copy(node):
+    return ast.parse(ast.unparse(node), mode='eval').body
+
+def vectorize_method(method, cls=None, max_depth=2, print_src=False, _registry=None):
+    """
+    Array-level version of a process method with scalar branches, that can be called once on whole gathered arrays.
+    if/else blocks and conditional expressions become np.where, min/max np.minimum/np.maximum, abs and math.* calls numpy ufuncs,
+    and self.method(...) helpers of cls are vectorized recursively.
+    Both branches of a condition being evaluated for all elements, floating point errors are ignored in branches.
+    :return: a function with the same signature as method (self included), or None if method cannot be vectorized.
+    """
+    if _registry is None:
+        _registry = {}
+    name = method.__name__
+    if name in _registry:
+        return _registry[name]
+    _registry[name] = None
+    try:
+        tree = ast.parse(textwrap.dedent(inspect.getsource(method)))
+    except (OSError, TypeError, SyntaxError):
+        return None
+    StripDecorators().visit(tree)
+    fdef = next(n for n in tree.body if isinstance(n, ast.FunctionDef))
+    if fdef.args.vararg or fdef.args.kwarg or fdef.args.kwonlyargs:
+        return None
+
+    # Helpers called on self are vectorized first
+    helpers, glb = {}, dict(method.__globals__)
+    if cls is not None and max_depth > 0:
+        for callee in sorted(_find_self_callees(fdef)):
+            if inspect.isfunction(getattr(cls, callee, None)):
+                vectorized = vectorize_method(getattr(cls, callee), cls, max_depth - 1, print_src, _registry)
+                if vectorized is not None:
+                    helpers[callee] = f"__VEC_{callee}"
+                    glb[helpers[callee]] = vectorized
+
+    expressions = _ArrayExpressions(helpers)
+    try:
+        fdef.body = [expressions.visit(st) for st in fdef.body]
+    except NotVectorizable:
+        return None
+    returns = [n.value for n in ast.walk(fdef) if isinstance(n, ast.Return)]
+    n_returned = len(returns[0].elts) if returns and isinstance(returns[0], ast.Tuple) else 1
+    converter = _IfConverter()
+    try:
+        body, all_return = _normalize_returns(fdef.body, n_returned)
+        if not all_return:
+            raise NotVectorizable("missing return")
+        env = {a.arg: ast.Name(id=a.arg, ctx=ast.Load()) for a in fdef.args.args}
+        body = converter.block(body, env)
+    except NotVectorizable:
+        return None
+    rets = [_copy(env[f'__ret{k}']) for k in range(n_returned)]
+    body.append(ast.Return(value=rets[0] if n_returned == 1 else ast.Tuple(elts=rets, ctx=ast.Load())))
+    fdef.body = body
+    fdef.name = name
+    ast.fix_missing_locations(tree)
+
+    gen_src = ast.unparse(tree)
+    if print_src:
+        print(f"\n=== vectorized {name} ===\n{gen_src}")
+    fake_fn = f"<vectorized:{name}:{_stable_hash(gen_src)}>"
+    linecache.cache[fake_fn] = (len(gen_src), None, gen_src.splitlines(True), fake_fn)
+    glb['__np'] = np
+    glb['__ignoring_errors'] = _call_ignoring_errors
+    ns = {}
+    try:
+        exec(compile(tree, fake_fn, "exec"), glb, ns)
+    except Exception:
+        return None
+    _registry[name] = ns[name]
+    return ns[name]
+
+
+# ------------------- Kernel fusion -------------------
+
+# Builtins computing a scalar from scalars, min and max being reductions when given a single argument
+_ELEMENTWISE_BUILTINS = {"abs", "float", "int", "bool", "round", "min", "max"}
+
+def _cached_per_kernel(analysis):
+    """analysis memoized per kernel, without keeping kernels and their compiled specializations alive."""
+    results = weakref.WeakKeyDictionary()
+    @functools.wraps(analysis)
+    def cached(kernel):
+        try:
+            return results[kernel]
+        except KeyError:
+            result = analysis(kernel)
+        except TypeError:
+            # Kernels that cannot be weakly referenced are analysed each time
+            return analysis(kernel)
+        results[kernel] = result
+        return result
+    return cached
+
+@_cached_per_kernel
+def is_elementwise(kernel) -> bool:
+    """
+    Whether a specialized kernel computes each element only from the same element of its arguments, 
+    so that calling it element by element gives its whole array result (see fuse_kernels).
+    Conservative : reductions, len, subscripts of arrays, loops, attributes of arrays (shape, sum...), injected arrays 
+    and numpy functions other than ufuncs and where reject the kernel, as do helpers that are not elementwise.
+    """
+    py_func = getattr(kernel, "py_func", kernel)
+    try:
+        tree = ast.parse(textwrap.dedent(inspect.getsource(py_func)))
+    except (OSError, TypeError, SyntaxError):
+        return False
+    fdef = next(n for n in tree.body if isinstance(n, ast.FunctionDef))
+    modules = {"np": np, "numpy": np, "math": None}
+    # Body only, annotations being subscripts of types
+    for n in (n for statement in fdef.body for n in ast.walk(statement)):
+        if isinstance(n, (ast.For, ast.While, ast.comprehension, ast.Lambda)):
+            return False
+        if isinstance(n, ast.Name) and n.id.startswith("__C_"):
+            return False
+        if isinstance(n, ast.Subscript):
+            # Parameters tuples and inlined constant tuples only
+            base = n.value
+            while isinstance(base, ast.Subscript):
+                base = base.value
+            constant = isinstance(base, ast.Constant) or (isinstance(base, ast.Tuple) and all(isinstance(e, ast.Constant) for e in base.elts))
+            if not (constant or (isinstance(base, ast.Name) and base.id == "__P")):
+                return False
+        if isinstance(n, ast.Attribute) and not (isinstance(n.value, ast.Name) and n.value.id in modules):
+            return False
+        if isinstance(n, ast.Call):
+            f = n.func
+            if isinstance(f, ast.Name):
+                if f.id.startswith("__HELP_"):
+                    helper = py_func.__globals__.get(f.id)
+                    if helper is None or not is_elementwise(helper):
+                        return False
+                elif f.id not in _ELEMENTWISE_BUILTINS or (f.id in ("min", "max") and len(n.args) < 2):
+                    return False
+            elif isinstance(f, ast.Attribute) and isinstance(f.value, ast.Name) and f.value.id in modules:
+                if modules[f.value.id] is not None and not (isinstance(getattr(np, f.attr, None), np.ufunc) or f.attr == "where"):
+                    return False
+            else:
+                return False
+    return True
+
+@_cached_per_kernel
+def writes_arguments(kernel) -> bool:
+    """
+    Whether a specialized kernel, or one of its helpers, may write its array arguments in place 
+    (augmented assignments or item assignments of arguments, out= keywords), in which case it is given copies.
+    """
+    py_func = getattr(kernel, "py_func", kernel)
+    try:
+        tree = ast.parse(textwrap.dedent(inspect.getsource(py_func)))
+    except (OSError, TypeError, SyntaxError):
+        return True
+    fdef = next(n for n in tree.body if isinstance(n, ast.FunctionDef))
+    arguments = {arg.arg for arg in fdef.args.args}
+    for n in (n for statement in fdef.body for n in ast.walk(statement)):
+        if isinstance(n, ast.AugAssign) and isinstance(n.target, ast.Name) and n.target.id in arguments:
+            return True
+        if (isinstance(n, ast.Subscript) and isinstance(n.ctx, ast.Store) and isinstance(n.value, ast.Name) 
+            and n.value.id in arguments):
+            return True
+        if isinstance(n, ast.Call):
+            if any(kw.arg == "out" for kw in n.keywords):
+                return True
+            if isinstance(n.func, ast.Name) and n.func.id.startswith("__HELP_"):
+                helper = py_func.__globals__.get(n.func.id)
+                if helper is None or writes_arguments(helper):
+                    return True
+    return False
+
+def _interleave(output_names):
+    """Output names in the (value, "name", value, ...) layout of kernel returns."""
+    layout = [output_names[0]]
+    for name in output_names[1:]:
+        layout += [None, name]
+    return layout
+
+def fuse_kernels(steps, scalar_names=(), nogil=False, print_src=False, parallel=False):
+    """
+    Fuse consecutive elementwise numba kernels (see is_elementwise) into a single kernel looping once over the focus elements.
+    Values are loaded once per element and kept in local variables, so that a property written by a step 
+    and read by a following one is passed directly (read-after-write in the order of steps).
+    :param steps: sequence of (jitted function, input property names, output property name[, parametric]), 
+    the parameters tuples of parametric kernels being passed after the properties, in the order of steps.
+    The output is a list of names for kernels returning supplementary outputs as (value, "name", value, ...)
+    :param scalar_names: properties passed as plant scale scalars rather than per vertex arrays
+    :param parallel: whether focus elements are split across numba threads, iterations being independent
+    :return: (fused numba dispatcher, ordered names of the properties to pass after the focus elements positions)
+    """
+    steps = [tuple(step) + (False,) * (4 - len(step)) for step in steps]
+    arguments = []
+    steps = [step[:2] + ([step[2]] if isinstance(step[2], str) else list(step[2]),) + step[3:] for step in steps]
+    for _, input_names, output_names, _ in steps:
+        for name in list(input_names) + output_names:
+            if name not in arguments:
+                arguments.append(name)
+
+    loop = ["__i = __mask[__j]"]
+    loaded = set(scalar_names)
+    for k, (_, input_names, output_names, parametric) in enumerate(steps):
+        for name in input_names:
+            if name not in loaded:
+                loop.append(f"v_{name} = p_{name}[__i]")
+                loaded.add(name)
+        call_args = ", ".join([name if name in scalar_names else f"v_{name}" for name in input_names] + ([f"__P{k}"] if parametric else []))
+        # Names of supplementary outputs are skipped
+        targets = ", ".join(f"v_{name}" if s % 2 == 0 else "__" for s, name in enumerate(_interleave(output_names)))
+        loop.append(f"{targets} = __K{k}({call_args})")
+        for name in output_names:
+            loop.append(f"p_{name}[__i] = v_{name}")
+            loaded.add(name)
+
+    signature = ", ".join(["__mask"] + [name if name in scalar_names else f"p_{name}" for name in arguments]
+                          + [f"__P{k}" for k, step in enumerate(steps) if step[3]])
+    src = f"def __fused({signature}):\n    for __j in {'prange' if parallel else 'range'}(__mask.size):\n" + "".join(f"        {line}\n" for line in loop)
+    tree = ast.parse(src)
+
+    gen_src = ast.unparse(tree)
+    if print_src:
+        print(f"\n=== fused {[step[2][0] for step in steps]} ===\n{gen_src}")
+    fake_fn = f"<fused:{_stable_hash(gen_src)}>"
+    linecache.cache[fake_fn] = (len(gen_src), None, gen_src.splitlines(True), fake_fn)
+    glb = {f"__K{k}": step[0] for k, step in enumerate(steps)}
+    glb["prange"] = prange
+    ns = {}
+    exec(compile(tree, fake_fn, "exec"), glb, ns)
+    kernel = njit(ns["__fused"], cache=False, nogil=nogil, parallel=parallel)
+    return without_parallel_warnings(kernel) if parallel else kernel, arguments
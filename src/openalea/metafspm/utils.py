@@ -1,112 +1,520 @@
+import weakref
 import numpy as np
-from collections.abc import MutableMapping
+from collections.abc import Mapping, MutableMapping, Sequence, MutableSequence
+from numpy.lib.mixins import NDArrayOperatorsMixin
 
 
-class ArrayDict(MutableMapping):
+class VertexIndex:
     """
-    Mapping[int -> float] backed by two aligned arrays:
+    Sorted vertex keys shared by one or several aligned value columns (ArrayDict):
       - order[i] = key at logical position i  (sorted ascending, invariant)
-      - arr[i]   = value for order[i]
+    Structural edits (insertion, deletion, reordering) are applied once here and replayed on every attached column,
+    so that columns only store their values.
     Also keeps a dict key -> current index for O(1) lookups/updates.
+    This dict is rebuilt lazily : structural edits only flag it as stale, and it is recomputed in one pass when next read.
+    With dense=True, lookups rather go through a dense int64 table lookup[key] = index (-1 for missing keys),
+    which suits the dense increasing vertex ids of MTGs and allows vectorized indices_of, scatter and membership tests.
+    With a compact_threshold, deletions only mark slots as dead (tombstones), and dead slots are removed in one vectorized pass
+    once they exceed this fraction of the slots, or before any array view, insertion or reordering needs a compacted layout.
     """
 
-    def __init__(self, init=None, dtype=np.float64, init_capacity=0):
+    def __init__(self, init_capacity=0, dense=False, compact_threshold=None):
         cap = max(int(init_capacity), 16)
-        self.arr   = np.empty(cap, dtype=dtype)
         self.order = np.empty(cap, dtype=np.int64)
-        self.vid2idx = {}
-        self.size = 0
+        self.size = 0  # used slots, including dead ones
+        self.alive = np.ones(cap, dtype=bool)
+        self.n_dead = 0
+        # Incremented on every structural edit, so that positions resolved once can be checked for validity
+        self.version = 0
+        self.compact_threshold = compact_threshold
+        self._column_refs = []
+        self._vid2idx = {}
+        self._stale = False
+        self.dense = dense
+        self._lookup = np.full(cap if dense else 0, -1, dtype=np.int64)
+        # Only maintained once used, so that plain ArrayDicts do not pay for it
+        self._lookup_stale = not dense
 
-        if init:
-            # Insert via __setitem__ to preserve sorted invariant
-            for k, v in init.items():
-                self[k] = v
+    def __len__(self):
+        return self.size - self.n_dead
+
+    def __reduce__(self):
+        # Only the live keys are sent, lookup mappings are rebuilt lazily on the receiving side
+        self.compact()
+        return (_rebuild_index, (self.order[:self.size], self.dense, self.compact_threshold))
+
+    @property
+    def capacity(self):
+        return self.order.size
+
+    @property
+    def columns(self) -> list:
+        """Attached columns still alive. They are weakly referenced so that temporary results sharing the index are released."""
+        columns = [ref() for ref in self._column_refs]
+        if None in columns:
+            self._column_refs = [ref for ref, c in zip(self._column_refs, columns) if c is not None]
+            columns = [c for c in columns if c is not None]
+        return columns
+
+    def attach(self, column):
+        self._column_refs.append(weakref.ref(column))
+
+    def detach(self, column):
+        self._column_refs = [ref for ref in self._column_refs if ref() is not column]
 
     # --- capacity management -------------------------------------------------
 
     def _ensure(self, need):
-        if need <= self.arr.size:
+        if need <= self.order.size:
             return
-        new = max(int(need), 2 * int(self.arr.size))
-        new_arr   = np.empty(new, dtype=self.arr.dtype)
+        self.version += 1
+        new = max(int(need), 2 * int(self.order.size))
         new_order = np.empty(new, dtype=self.order.dtype)
         # copy current slice
         if self.size:
-            new_arr[:self.size]   = self.arr[:self.size]
             new_order[:self.size] = self.order[:self.size]
-        self.arr, self.order = new_arr, new_order
+        self.order = new_order
+        new_alive = np.ones(new, dtype=bool)
+        new_alive[:self.size] = self.alive[:self.size]
+        self.alive = new_alive
+        for column in self.columns:
+            column._resize(new)
 
-    # --- basic mapping protocol ---------------------------------------------
+    # --- lazy key -> index mapping ------------------------------------------
 
-    def __getitem__(self, k: int) -> float:
-        return float(self.arr[self.vid2idx[k]])
+    @property
+    def vid2idx(self) -> dict:
+        """key -> position mapping, rebuilt in one pass if structural edits made it stale."""
+        if self._stale:
+            if self.n_dead:
+                live = np.flatnonzero(self.alive[:self.size])
+                self._vid2idx = dict(zip(self.order[live].tolist(), live.tolist()))
+            else:
+                self._vid2idx = dict(zip(self.order[:self.size].tolist(), range(self.size)))
+            self._stale = False
+        return self._vid2idx
 
-    def __len__(self):  # mapping size
-        return self.size
+    def _mark_stale(self):
+        self._stale = True
+        self._lookup_stale = True
 
-    def __iter__(self):  # iterate keys in sorted order
-        # Cast to int to avoid numpy scalar types leaking out
-        for i in range(self.size):
-            yield int(self.order[i])
+    def _ensure_lookup(self, max_key):
+        if max_key < self._lookup.size:
+            return
+        new = np.full(max(int(max_key) + 1, 2 * int(self._lookup.size)), -1, dtype=np.int64)
+        new[:self._lookup.size] = self._lookup
+        self._lookup = new
 
-    # --- sorted insert / delete ---------------------------------------------
+    @property
+    def lookup(self) -> np.ndarray:
+        """Dense key -> position table (-1 for missing keys), rebuilt in one vectorized pass if stale."""
+        if self._lookup_stale:
+            keys = self.order[:self.size]
+            if self.size and keys[0] < 0:
+                raise ValueError("Dense index requires non-negative keys")
+            self._lookup.fill(-1)
+            if self.size:
+                self._ensure_lookup(keys[-1])
+                if self.n_dead:
+                    live = np.flatnonzero(self.alive[:self.size])
+                    self._lookup[keys[live]] = live
+                else:
+                    self._lookup[keys] = np.arange(self.size, dtype=np.int64)
+            self._lookup_stale = False
+        return self._lookup
 
-    def __setitem__(self, k: int, v: float):
-        idx = self.vid2idx.get(k)
-        if idx is not None:  # existing -> O(1) update
-            self.arr[idx] = v
-            return
+    def _register_appended(self, keys, start):
+        """Extend the up-to-date mappings with keys appended from position start."""
+        if not self._stale:
+            self._vid2idx.update(zip(keys.tolist(), range(start, start + keys.size)))
+        if not self._lookup_stale:
+            if keys[0] < 0:
+                self._lookup_stale = True
+            else:
+                self._ensure_lookup(keys[-1])
+                self._lookup[keys] = np.arange(start, start + keys.size, dtype=np.int64)
+
+    def position(self, k):
+        """Current position of key k, or None if absent."""
+        if self.dense:
+            lookup = self.lookup
+            if 0 <= k < lookup.size:
+                idx = lookup[k]
+                if idx >= 0:
+                    return int(idx)
+            return None
+        return self.vid2idx.get(k)
+
+    def live_mask(self) -> np.ndarray:
+        """Mask of the used slots that are not tombstones."""
+        return self.alive[:self.size]
 
-        self._ensure(self.size + 1)
-        pos = int(np.searchsorted(self.order[:self.size], k))  # keep ascending
+    def keys(self) -> np.ndarray:
+        """Live keys (ascending), as a view when there are no tombstones."""
+        if self.n_dead:
+            return self.order[:self.size][self.alive[:self.size]]
+        return self.order[:self.size]
+
+    def locate(self, keys):
+        """Insertion positions of keys in the current order and mask of the keys already present."""
+        self.compact()
+        current = self.order[:self.size]
+        pos = np.searchsorted(current, keys)
+        found = pos < self.size
+        found[found] = current[pos[found]] == keys[found]
+        return pos, found
+
+    def indices_of(self, vids):
+        # Positions are given in the compacted layout used by array views
+        self.compact()
+        return self._slots_of(vids)
+
+    def _slots_of(self, vids):
+        """Current slot of each of vids, KeyError if any is absent."""
+        if self.dense:
+            vids = np.asarray(vids, dtype=np.int64)
+            if vids.size == 0:
+                return np.empty(0, dtype=np.int64)
+            lookup = self.lookup
+            idxs = lookup[np.clip(vids, 0, lookup.size - 1)]
+            missing = (idxs < 0) | (vids < 0) | (vids >= lookup.size)
+            if missing.any():
+                raise KeyError(vids[missing][0])
+            return idxs
+        vid2idx = self.vid2idx
+        return np.fromiter((vid2idx[v] for v in vids),
+                           count=len(vids), dtype=np.int64)
+
+    def contains_many(self, vids) -> np.ndarray:
+        """Boolean mask telling which of vids are keys of the index."""
+        vids = np.asarray(vids, dtype=np.int64)
+        if self.dense:
+            lookup = self.lookup
+            inside = (vids >= 0) & (vids < lookup.size)
+            inside[inside] = lookup[vids[inside]] >= 0
+            return inside
+        return self.locate(vids)[1]
+
+    # --- sorted insert / delete ---------------------------------------------
+
+    def insert_one(self, k, column=None, value=None):
+        """Insert a new key k, column receiving value and other attached columns their fill_value."""
+        self.compact()
+        n = self.size
+        self._ensure(n + 1)
+        self.version += 1
+        pos = int(np.searchsorted(self.order[:n], k))  # keep ascending
 
         # shift right suffix [pos:size)
-        if pos < self.size:
-            self.arr[pos+1:self.size+1]   = self.arr[pos:self.size]
-            self.order[pos+1:self.size+1] = self.order[pos:self.size]
+        if pos < n:
+            self.order[pos+1:n+1] = self.order[pos:n]
+            for c in self.columns:
+                c.arr[pos+1:n+1] = c.arr[pos:n]
+            # moved suffix, mapping will be rebuilt on next read
+            self._mark_stale()
+        else:
+            self._register_appended(np.array([k], dtype=np.int64), pos)
 
         # insert
         self.order[pos] = k
-        self.arr[pos]   = v
-        self.size += 1
+        for c in self.columns:
+            c.arr[pos] = value if c is column else c.fill_value
+        self.size = n + 1
 
-        # rebuild mapping for moved suffix (including new key)
-        for i in range(pos, self.size):
-            self.vid2idx[int(self.order[i])] = i
+    def insert_new(self, keys, pos, provided=()):
+        """
+        Merge sorted keys absent from the index in a single vectorized pass.
 
+        :param keys: sorted array of new keys
+        :param pos: insertion positions of keys in the current order
+        :param provided: (column, values) pairs for columns receiving values, other attached columns are set to their fill_value
+        """
+        if keys.size == 0:
+            return
+        self.compact()
+        n, m = self.size, keys.size
+        self._ensure(n + m)
+        self.version += 1
+        values_for = {id(c): v for c, v in provided}
 
-    def __delitem__(self, k: int):
-        idx = self.vid2idx.pop(k)  # KeyError if absent
+        # fast append if monotone extension
+        if n == 0 or keys[0] > self.order[n - 1]:
+            self.order[n:n + m] = keys
+            for c in self.columns:
+                c.arr[n:n + m] = values_for.get(id(c), c.fill_value)
+            self._register_appended(keys, n)
+            self.size = n + m
+            return
+
+        # otherwise new keys land at pos + their rank among new keys
+        is_new = np.zeros(n + m, dtype=bool)
+        is_new[pos + np.arange(m)] = True
+        kept = ~is_new
+
+        merged = np.empty(n + m, dtype=self.order.dtype)
+        merged[is_new], merged[kept] = keys, self.order[:n]
+        self.order[:n + m] = merged
+        for c in self.columns:
+            merged = np.empty(n + m, dtype=c.arr.dtype)
+            merged[is_new], merged[kept] = values_for.get(id(c), c.fill_value), c.arr[:n]
+            c.arr[:n + m] = merged
+
+        self.size = n + m
+        self._mark_stale()
+
+    def upsert(self, keys, provided=()):
+        """
+        Bulk insertion / update of keys in a single vectorized merge.
+        Existing keys get their provided values in place, new keys are merged so that the ascending order invariant holds.
+        If a key is repeated, the last provided value is kept.
+
+        :param keys: sequence or array of integer keys
+        :param provided: (column, values) pairs, values being aligned with keys (or a scalar broadcasted to all keys)
+        """
+        keys = np.asarray(keys, dtype=np.int64).ravel()
+        if keys.size == 0:
+            return
+        provided = [(c, np.broadcast_to(np.asarray(v, dtype=c.arr.dtype), keys.shape)) for c, v in provided]
+
+        # Deduplicate, keeping the last occurence of each key, and sort
+        if keys.size > 1 and not np.all(keys[:-1] < keys[1:]):
+            keys, last = np.unique(keys[::-1], return_index=True)
+            provided = [(c, v[::-1][last]) for c, v in provided]
+
+        # 1) existing keys -> scatter in place
+        pos, found = self.locate(keys)
+        if found.any():
+            for c, v in provided:
+                c.arr[pos[found]] = v[found]
+            if found.all():
+                return
+            new = ~found
+            keys, pos = keys[new], pos[new]
+            provided = [(c, v[new]) for c, v in provided]
 
-        if idx < self.size - 1:
+        # 2) new keys -> keep array sorted
+        self.insert_new(keys, pos, provided)
+
+    def delete_at(self, idx):
+        n = self.size
+        self.version += 1
+        k = int(self.order[idx])
+        if self.compact_threshold is not None:
+            # Tombstone, only the mappings are updated
+            self.alive[idx] = False
+            self.n_dead += 1
+            if not self._stale:
+                del self._vid2idx[k]
+            if not self._lookup_stale:
+                self._lookup[k] = -1
+            if self.n_dead > self.compact_threshold * n:
+                self.compact()
+            return
+
+        if idx < n - 1:
             # shift left suffix (idx+1:size)
-            self.arr[idx:self.size-1]   = self.arr[idx+1:self.size]
-            self.order[idx:self.size-1] = self.order[idx+1:self.size]
+            self.order[idx:n-1] = self.order[idx+1:n]
+            for c in self.columns:
+                c.arr[idx:n-1] = c.arr[idx+1:n]
+            self._mark_stale()
+        else:
+            if not self._stale:
+                del self._vid2idx[k]
+            if not self._lookup_stale:
+                self._lookup[k] = -1
+        self.size = n - 1
 
-        self.size -= 1
+    def remove(self, keys):
+        """Delete many keys at once, as tombstones or with a single vectorized compaction. KeyError if any is absent."""
+        idxs = np.unique(self._slots_of(keys))
+        if idxs.size == 0:
+            return
+        self.alive[idxs] = False
+        self.n_dead += idxs.size
+        self.version += 1
+        self._mark_stale()
+        if self.compact_threshold is None or self.n_dead > self.compact_threshold * self.size:
+            self.compact()
 
-        # rebuild mapping for moved suffix
-        for i in range(idx, self.size):
-            self.vid2idx[int(self.order[i])] = i
+    def compact(self):
+        """Remove dead slots in one vectorized pass over the index and every attached column."""
+        if self.n_dead == 0:
+            return
+        keep = self.alive[:self.size]
+        n = self.size - self.n_dead
+        self.order[:n] = self.order[:self.size][keep]
+        for c in self.columns:
+            c.arr[:n] = c.arr[:self.size][keep]
+        self.alive[:self.size] = True
+        self.size, self.n_dead = n, 0
+        self.version += 1
+        self._mark_stale()
 
+    def reindex_sorted_inplace(self):
+        self.compact()
+        if self.size <= 1: return
+        p = np.argsort(self.order[:self.size], kind="mergesort")
+        self.order[:self.size] = self.order[:self.size][p]
+        for c in self.columns:
+            c.arr[:self.size] = c.arr[:self.size][p]
+        self.version += 1
+        self._mark_stale()
+
+    def check_invariant(self):
+        if self.size == 0: return True
+        keys = self.order[:self.size]
+        if not np.all(keys[:-1] <= keys[1:]):
+            return False
+
+        live = np.flatnonzero(self.alive[:self.size])
+        if live.size != self.size - self.n_dead:
+            return False
+        vid2idx = self.vid2idx
+        if len(vid2idx) != live.size:
+            return False
+        for i in live:
+            if not vid2idx[int(keys[i])] == i:
+                return False
+        if self.dense and not np.array_equal(self.lookup[keys[live]], live):
+            return False
+        return all(c.arr.size == self.order.size for c in self.columns)
+
+
+class ArrayDict(NDArrayOperatorsMixin, MutableMapping):
+    """
+    Mapping[int -> float] backed by two aligned arrays:
+      - order[i] = key at logical position i  (sorted ascending, invariant), held by a VertexIndex
+      - arr[i]   = value for order[i]
+    The VertexIndex can be shared between several ArrayDicts (see PropertyTable), in which case they always have the same key set :
+    inserting a key through one of them gives its fill_value to the others, and deleting a key removes it from all of them.
+    See VertexIndex for the compact_threshold tombstone deletion mode.
+    NumPy sees an ArrayDict as its live values (np.asarray(a) is a view), and ufuncs or operators (a * b, a + 3., a > 0) 
+    between aligned ArrayDicts return a new ArrayDict sharing their index, with no Python-level loop.
+    """
+
+    def __init__(self, init=None, dtype=np.float64, init_capacity=0, dense_index=False, index=None, fill_value=0, compact_threshold=None):
+        if index is None:
+            index = VertexIndex(init_capacity=init_capacity, dense=dense_index, compact_threshold=compact_threshold)
+        self.index = index
+        self.fill_value = fill_value
+        self.arr = np.empty(index.capacity, dtype=dtype)
+        self.arr[:index.size] = fill_value
+        index.attach(self)
+
+        if init:
+            self.update(init)
+
+    def __reduce__(self):
+        # Only the live values are sent, the index being pickled once even if shared by several ArrayDicts
+        self.index.compact()
+        return (_rebuild_arraydict, (self.index, self.arr[:self.size], self.fill_value))
+
+    # --- shared index views --------------------------------------------------
+
+    @property
+    def order(self) -> np.ndarray:
+        return self.index.order
+
+    @property
+    def size(self) -> int:
+        return self.index.size
+
+    @property
+    def vid2idx(self) -> dict:
+        return self.index.vid2idx
+
+    @property
+    def lookup(self) -> np.ndarray:
+        return self.index.lookup
+
+    @property
+    def dense_index(self) -> bool:
+        return self.index.dense
+
+    @property
+    def dtype(self) -> np.dtype:
+        return self.arr.dtype
+
+    # --- capacity management -------------------------------------------------
+
+    def _ensure(self, need):
+        self.index._ensure(need)
+
+    def _resize(self, new):
+        new_arr = np.empty(new, dtype=self.arr.dtype)
+        # copy current slice
+        if self.size:
+            new_arr[:self.size] = self.arr[:self.size]
+        self.arr = new_arr
+
+    # --- basic mapping protocol ---------------------------------------------
+
+    def __getitem__(self, k: int) -> float:
+        idx = self.index.position(k)
+        if idx is None:
+            raise KeyError(k)
+        # Native Python scalar of the column dtype
+        return self.arr[idx].item()
+
+    def __len__(self):  # mapping size
+        return len(self.index)
+
+    def __iter__(self):  # iterate keys in sorted order
+        # Cast to int to avoid numpy scalar types leaking out
+        return iter(self.index.keys().tolist())
+
+    def __contains__(self, k):
+        return self.index.position(k) is not None
+
+    # --- sorted insert / delete ---------------------------------------------
+
+    def __setitem__(self, k: int, v: float):
+        idx = self.index.position(k)
+        if idx is not None:  # existing -> O(1) update
+            self.arr[idx] = v
+            return
+        self.index.insert_one(k, self, v)
+
+    def __delitem__(self, k: int):
+        idx = self.index.position(k)
+        if idx is None:
+            raise KeyError(k)
+        self.index.delete_at(idx)
+
+    def delete_many(self, keys):
+        """Delete many keys at once, see VertexIndex.remove."""
+        self.index.remove(keys)
 
     # --- handy array views ---------------------------------------------------
 
+    def cast(self, dtype):
+        """Changes the storage dtype in place, the property keeping its identity and its index."""
+        self.arr = self.arr.astype(dtype)
+
     def values_array(self) -> np.ndarray:
-        """Values aligned with keys in ascending key order."""
+        """Values aligned with keys in ascending key order (pending tombstones are compacted first)."""
+        self.index.compact()
         return self.arr[:self.size]
 
     def keys_array(self) -> np.ndarray:
         """Keys (ascending)."""
-        return self.order[:self.size].copy()
+        return self.index.keys().copy()
+
+    def live_mask(self) -> np.ndarray:
+        """Mask of live slots in arr[:size], for reading values without compacting pending tombstones."""
+        return self.index.live_mask()
 
     # --- indexed / scatter ops ----------------------------------------------
 
     def indices_of(self, vids):
-        return np.fromiter((self.vid2idx[v] for v in vids),
-                           count=len(vids), dtype=np.int64)
+        return self.index.indices_of(vids)
+
+    def contains_many(self, vids) -> np.ndarray:
+        """Boolean mask telling which of vids are keys of the mapping."""
+        return self.index.contains_many(vids)
 
     def assign_all(self, values):
+        self.index.compact()
         values = np.asarray(values, dtype=self.arr.dtype)
         if values.shape[0] != self.size:
             raise ValueError(f"assign_all length mismatch: got {values.shape[0]}, need {self.size}")
@@ -120,108 +528,503 @@ class ArrayDict(MutableMapping):
 
     # --- batch update that preserves sorting --------------------------------
 
+    def insert_many(self, keys, values):
+        """
+        Bulk insertion / update of (key, value) pairs in a single vectorized merge.
+        Existing keys are updated in place, new keys are merged so that the ascending order invariant holds.
+        If a key is repeated, the last provided value is kept.
+        The key -> index mapping is only extended for appended keys, otherwise it is flagged to be rebuilt on next read,
+        so that the cost of inserting m new keys at the end of the array is O(m) whatever the current size.
+
+        :param keys: sequence or array of integer keys
+        :param values: sequence or array of values aligned with keys (or a scalar broadcasted to all keys)
+        """
+        self.index.upsert(keys, [(self, values)])
+
     def update(self, d: dict):
         if not d:
             return
 
-        has = self.vid2idx.__contains__
-        existing, new_items = [], []
-        for k, v in d.items():
-            (existing if has(k) else new_items).append((k, v))
-
-        # 1) existing keys -> scatter in place
-        if existing:
-            self.scatter([k for k, _ in existing], [v for _, v in existing])
+        if isinstance(d, ArrayDict):
+            if d.index is self.index:
+                values = d.values_array()
+                self.arr[:self.size] = values
+            else:
+                self.insert_many(d.keys_array(), d.values_array())
+        else:
+            self.insert_many(np.fromiter(d.keys(), dtype=np.int64, count=len(d)),
+                             np.asarray(list(d.values()), dtype=self.arr.dtype))
 
-        # 2) new keys -> keep array sorted
-        if not new_items:
-            return
+    # --- NumPy interoperability ----------------------------------------------
 
-        new_items.sort(key=lambda kv: kv[0])  # sort by key
-        nk = np.fromiter((k for k, _ in new_items), dtype=np.int64, count=len(new_items))
-        nv = np.asarray([v for _, v in new_items], dtype=self.arr.dtype)
+    # Mapping equality is kept for == and !=, elementwise equality goes through np.equal
+    __eq__ = Mapping.__eq__
 
-        # fast append if monotone extension
-        if self.size == 0 or nk[0] >= int(self.order[self.size - 1]):
-            self._ensure(self.size + nk.size)
-            start, end = self.size, self.size + nk.size
-            self.order[start:end] = nk
-            self.arr[start:end]   = nv
-            for i in range(start, end):  # rebuild mapping for appended
-                self.vid2idx[int(self.order[i])] = i
-            self.size = end
-            return
+    def __ne__(self, other):
+        eq = self.__eq__(other)
+        return eq if eq is NotImplemented else not eq
 
-        # otherwise do a full merge
-        ok = self.order[:self.size].copy()
-        ov = self.arr[:self.size].copy()
+    def __array__(self, dtype=None, copy=None):
+        values = self.values_array()
+        if dtype is not None and values.dtype != dtype:
+            return values.astype(dtype)
+        return values.copy() if copy else values
 
-        total = ok.size + nk.size
-        self._ensure(total)
+    def __buffer__(self, flags):
+        return memoryview(self.values_array())
 
-        i = j = t = 0
-        while i < ok.size and j < nk.size:
-            if ok[i] <= nk[j]:
-                self.order[t] = ok[i]; self.arr[t] = ov[i]; i += 1
-            else:
-                self.order[t] = nk[j]; self.arr[t] = nv[j]; j += 1
-            t += 1
+    def aligned_with(self, other) -> bool:
+        """Whether other holds the same keys in the same order, so that values can be combined elementwise."""
+        return other.index is self.index or np.array_equal(other.index.keys(), self.index.keys())
 
-        if i < ok.size:
-            r = ok.size - i
-            self.order[t:t+r] = ok[i:]; self.arr[t:t+r] = ov[i:]; t += r
-        if j < nk.size:
-            r = nk.size - j
-            self.order[t:t+r] = nk[j:]; self.arr[t:t+r] = nv[j:]; t += r
+    def _aligned_values(self, x):
+        if isinstance(x, ArrayDict):
+            if not self.aligned_with(x):
+                raise ValueError("Elementwise operations require ArrayDicts with the same key set")
+            return x.values_array()
+        return x
 
-        self.size = t
-        # rebuild full mapping
-        self.vid2idx.clear()
-        for i in range(self.size):
-            self.vid2idx[int(self.order[i])] = i
+    def _wrap(self, values):
+        """New ArrayDict sharing this index and holding values."""
+        result = ArrayDict(dtype=values.dtype, index=self.index)
+        result.arr[:self.size] = values
+        return result
 
+    def __array_ufunc__(self, ufunc, method, *inputs, out=None, **kwargs):
+        inputs = tuple(self._aligned_values(x) for x in inputs)
+        if out is not None:
+            for o in out:
+                # Writing a broadcast property allocates its column
+                if isinstance(o, BroadcastArrayDict):
+                    o._materialize()
+            kwargs["out"] = tuple(self._aligned_values(o) for o in out)
 
+        result = getattr(ufunc, method)(*inputs, **kwargs)
+        if out is not None:
+            return out[0] if len(out) == 1 else out
+        # Reductions and other methods return plain NumPy results
+        if method != "__call__":
+            return result
+        if isinstance(result, tuple):
+            return tuple(self._wrap(r) for r in result)
+        return self._wrap(result)
 
     # --- utilities -----------------------------------------------------------
 
     def to_dict(self):
         # Already in key order; order of dict doesn’t matter here
-        return {int(k): float(v) for k, v in self.items()}
+        return dict(zip(self.keys_array().tolist(), self.values_array().tolist()))
     
     def reindex_sorted_inplace(self):
-        if self.size <= 1: return
-        p = np.argsort(self.order[:self.size], kind="mergesort")
-        self.order[:self.size] = self.order[:self.size][p]
-        self.arr[:self.size]   = self.arr[:self.size][p]
-        self.vid2idx.clear()
-        for i, k in enumerate(self.order[:self.size]):
-            self.vid2idx[int(k)] = i
+        self.index.reindex_sorted_inplace()
 
     def check_invariant(self):
-        if self.size == 0: return True
-        keys = self.order[:self.size]
-        if not np.all(keys[:-1] <= keys[1:]):
-            return False
-        
-        for i, k in enumerate(keys):
-            if not self.vid2idx[int(k)] == i:
-                return False
-        return True
+        return self.arr.size == self.index.capacity and self.index.check_invariant()
+
+
+def _rebuild_index(keys, dense, compact_threshold):
+    index = VertexIndex(init_capacity=len(keys), dense=dense, compact_threshold=compact_threshold)
+    index.order[:len(keys)] = keys
+    index.size = len(keys)
+    index._mark_stale()
+    return index
+
+
+def _rebuild_arraydict(index, values, fill_value):
+    ad = ArrayDict(dtype=values.dtype, index=index, fill_value=fill_value)
+    ad.arr[:index.size] = values
+    return ad
+
+
+class BroadcastArrayDict(ArrayDict):
+    """
+    Copy-on-write ArrayDict holding the same scalar for every key of its index.
+    Reads (mapping access, values_array as a read-only broadcasted view, NumPy operations) never allocate a column,
+    which is only materialized on the first write (item assignment, update, assign_at...) or direct access to arr.
+    Until then, the property is not attached to its index, and vertices inserted by other properties also get the scalar.
+    """
+
+    def __init__(self, scalar, index, dtype=np.float64):
+        self.index = index
+        self.scalar = scalar
+        self.fill_value = scalar
+        self._dtype = np.dtype(dtype)
+        self._arr = None
+
+    @property
+    def materialized(self) -> bool:
+        return self._arr is not None
+
+    def _materialize(self):
+        if self._arr is None:
+            self._arr = np.full(self.index.capacity, self.scalar, dtype=self._dtype)
+            self.index.attach(self)
+
+    @property
+    def arr(self) -> np.ndarray:
+        self._materialize()
+        return self._arr
+
+    @arr.setter
+    def arr(self, value):
+        self._arr = value
+
+    @property
+    def dtype(self) -> np.dtype:
+        return self._dtype
+
+    def cast(self, dtype):
+        self._dtype = np.dtype(dtype)
+        if self.materialized:
+            self._arr = self._arr.astype(dtype)
+
+    def __reduce__(self):
+        if self.materialized:
+            return super().__reduce__()
+        return (BroadcastArrayDict, (self.scalar, self.index, self._dtype))
+
+    def __getitem__(self, k: int) -> float:
+        if self.materialized:
+            return super().__getitem__(k)
+        if self.index.position(k) is None:
+            raise KeyError(k)
+        return self._dtype.type(self.scalar).item()
+
+    def __setitem__(self, k: int, v: float):
+        self._materialize()
+        super().__setitem__(k, v)
+
+    def values_array(self) -> np.ndarray:
+        if self.materialized:
+            return super().values_array()
+        self.index.compact()
+        return np.broadcast_to(np.asarray(self.scalar, dtype=self._dtype), (self.size,))
+
+    def check_invariant(self):
+        if self.materialized:
+            return super().check_invariant()
+        return self.index.check_invariant()
+
+
+class ScalarProperty(MutableMapping):
+    """
+    Plant scale property holding a single scalar, read and written directly through .value.
+    For compatibility with per-vertex properties, it is also a Mapping exposing this value under the collar vertex key 1.
+    """
+
+    key = 1
+
+    def __init__(self, value=0.):
+        self.value = value
+
+    def __getitem__(self, k: int):
+        if k != self.key:
+            raise KeyError(k)
+        return self.value
+
+    def __setitem__(self, k: int, v):
+        if k != self.key:
+            raise KeyError(f"Plant scale property only stores vertex {self.key}, got {k}")
+        self.value = v
+
+    def __delitem__(self, k: int):
+        raise TypeError("Plant scale property value cannot be deleted")
+
+    def __iter__(self):
+        yield self.key
+
+    def __len__(self):
+        return 1
+
+    def update(self, d: dict):
+        for k, v in d.items():
+            self[k] = v
+
+    def values_array(self) -> np.ndarray:
+        return np.array([self.value])
+
+    def to_dict(self):
+        return {self.key: self.value}
 
 
-def mtg_to_arraydict(g, ignore: list = []):
+class FocusElements(MutableSequence):
+    """
+    Vertices on which per-element processes are computed, as a sorted key array over a VertexIndex.
+    It is used as the list of vertex ids growth models edit (append, extend, +=, insert, item and slice assignment, del...), 
+    kept sorted and without duplicates, and also caches the positions of these vertices in the index (gather indices), 
+    computed once per structural version and shared by every functor of a step.
+    version is incremented whenever the set of focus elements changes, including when vertices are removed from the index.
+    """
+
+    def __init__(self, index, vids=()):
+        self.index = index
+        self.vids = np.unique(np.asarray(vids, dtype=np.int64))
+        self.version = 0
+        self._slots = None
+        self._mask = None
+        self._index_version = None
+
+    def __len__(self):
+        self._sync()
+        return self.vids.size
+
+    def __getitem__(self, i):
+        self._sync()
+        if isinstance(i, slice):
+            return self.vids[i].tolist()
+        return int(self.vids[i])
+
+    def __iter__(self):
+        self._sync()
+        return iter(self.vids.tolist())
+
+    def __contains__(self, k):
+        self._sync()
+        i = np.searchsorted(self.vids, k)
+        return i < self.vids.size and self.vids[i] == k
+
+    def __array__(self, dtype=None, copy=None):
+        self._sync()
+        return self.vids if dtype is None else self.vids.astype(dtype)
+
+    def __eq__(self, other):
+        if isinstance(other, str) or not isinstance(other, (Sequence, np.ndarray)):
+            return NotImplemented
+        return list(self) == list(other)
+
+    def __setitem__(self, i, vids):
+        # Replaced vertices are removed and new ones inserted at their sorted position
+        self._sync()
+        kept = np.delete(self.vids, np.arange(self.vids.size)[i])
+        self.assign(np.concatenate([kept, np.asarray(vids, dtype=np.int64).ravel()]))
+
+    def __delitem__(self, i):
+        self._sync()
+        self.discard(self.vids[i])
+
+    def _changed(self):
+        self.version += 1
+        self._index_version = None
+
+    def assign(self, vids):
+        """Replace the focus elements."""
+        self.vids = np.unique(np.asarray(vids, dtype=np.int64))
+        self._changed()
+
+    def add(self, vids):
+        """Add vertices to the focus elements (for example new segments), once they have been inserted in the index."""
+        vids = np.asarray(vids, dtype=np.int64).ravel()
+        if vids.size:
+            self.vids = np.union1d(self.vids, vids)
+            self._changed()
+
+    def discard(self, vids):
+        """Remove vertices from the focus elements (for example dead segments), absent ones being ignored."""
+        vids = np.asarray(vids, dtype=np.int64).ravel()
+        if vids.size:
+            kept = np.isin(self.vids, vids, invert=True)
+            if not kept.all():
+                self.vids = self.vids[kept]
+                self._changed()
+
+    def append(self, vid):
+        self.add([vid])
+
+    def extend(self, vids):
+        self.add(list(vids))
+
+    def insert(self, i, vid):
+        # Position is ignored as vertices are kept sorted
+        self.add([vid])
+
+    def remove(self, vid):
+        if vid not in self:
+            raise ValueError(f"{vid} is not a focus element")
+        self.discard([vid])
+
+    def _sync(self):
+        if self._index_version == self.index.version:
+            return
+        # Positions are given in the compacted layout used by array views
+        self.index.compact()
+        present = self.index.contains_many(self.vids)
+        if not present.all():
+            # Vertices removed from the index are not computed anymore
+            self.vids = self.vids[present]
+            self.version += 1
+        self._slots = self.index.indices_of(self.vids)
+        self._mask = None
+        self._index_version = self.index.version
+
+    def slots(self) -> np.ndarray:
+        """Positions of the focus elements in the index arrays, recomputed only after structural changes."""
+        self._sync()
+        return self._slots
+
+    def mask(self) -> np.ndarray:
+        """Boolean mask of the focus elements over the index arrays."""
+        self._sync()
+        if self._mask is None:
+            self._mask = np.zeros(len(self.index), dtype=bool)
+            self._mask[self._slots] = True
+        return self._mask
+
+
+class PropertyTable(MutableMapping):
+    """
+    Struct-of-arrays storage of per-vertex properties : one VertexIndex shared by many aligned value columns.
+    Mapping[str -> ArrayDict], each column still being a Mapping[int -> value] that can be stored in MTG properties.
+    Inserting a vertex is a single index update followed by a write at the same position of every column.
+    """
+
+    def __init__(self, keys=None, init_capacity=0, dense_index=True, compact_threshold=0.25):
+        self.index = VertexIndex(init_capacity=init_capacity, dense=dense_index, compact_threshold=compact_threshold)
+        self.columns = {}
+        if keys is not None:
+            self.index.upsert(keys)
+
+    def add_column(self, name, values=None, dtype=np.float64, fill_value=0):
+        """
+        Create a column sharing the table index. Vertices missing in values get fill_value, 
+        values keys missing in the table are inserted in it.
+        """
+        if name in self.columns:
+            self.index.detach(self.columns[name])
+        column = ArrayDict(values, dtype=dtype, index=self.index, fill_value=fill_value)
+        self.columns[name] = column
+        return column
+
+    def __getitem__(self, name) -> ArrayDict:
+        return self.columns[name]
+
+    def __setitem__(self, name, values):
+        self.add_column(name, values)
+
+    def __delitem__(self, name):
+        self.index.detach(self.columns.pop(name))
+
+    def __iter__(self):
+        return iter(self.columns)
+
+    def __len__(self):
+        return len(self.columns)
+
+    @property
+    def n_vertices(self) -> int:
+        return len(self.index)
+
+    def keys_array(self) -> np.ndarray:
+        """Vertex keys (ascending)."""
+        return self.index.keys().copy()
+
+    def insert(self, keys, **values):
+        """
+        Insert or update vertices in a single index update, 
+        columns named in values receiving the provided values and others their fill_value for the new vertices.
+        """
+        self.index.upsert(keys, [(self.columns[name], v) for name, v in values.items()])
+
+    def remove(self, keys):
+        """Remove vertices from every column, as tombstones compacted once they exceed compact_threshold."""
+        self.index.remove(keys)
+
+    def check_invariant(self):
+        return self.index.check_invariant()
+
+
+def infer_dtype(values, float_dtype=np.float64):
+    """
+    Infers the most compact dtype storing values without loss : bool, int8, int32 or int64 depending on their range, or float_dtype.
+    None values are stored as NaN, which requires a floating dtype.
+
+    :param values: sequence of scalars
+    :param float_dtype: dtype used for floating values
+    :return: (array of values, dtype), or (None, None) if values are not numeric scalars
+    """
+    try:
+        arr = np.asarray(values)
+        if arr.dtype == object:
+            arr = np.asarray([np.nan if value is None else value for value in values], dtype=float_dtype)
+    except (TypeError, ValueError):
+        return None, None
+
+    if arr.ndim != 1:
+        return None, None
+    if arr.dtype.kind == "b":
+        dtype = np.dtype(bool)
+    elif arr.dtype.kind in "iu":
+        low, high = (int(arr.min()), int(arr.max())) if arr.size else (0, 0)
+        for dtype in (np.dtype(np.int8), np.dtype(np.int32), np.dtype(np.int64)):
+            if np.iinfo(dtype).min <= low and high <= np.iinfo(dtype).max:
+                break
+    elif arr.dtype.kind == "f":
+        dtype = np.dtype(float_dtype)
+    else:
+        return None, None
+
+    return arr.astype(dtype, copy=False), dtype
+
+
+def mtg_to_arraydict(g, ignore: list = [], dense_index: bool = False, shared_index: bool = True, float_dtype=np.float64, dtypes: dict = {},
+                     integer_properties: list = []):
+    """
+    Converts numeric MTG properties into ArrayDicts, with a compact dtype inferred per property (see infer_dtype),
+    each array being built in bulk from the property dict.
+    Properties holding integer values are stored as float_dtype unless their dtype is given in dtypes, or they are listed 
+    in integer_properties, as floating variables may only hold integer values yet (zeros) and later writes would be truncated.
+    With shared_index, the properties defined on every vertex of the finest scale become columns of a single PropertyTable,
+    other properties (plant scale ones for example) are converted into standalone ArrayDicts.
+    Properties aliased under several names stay aliased.
+
+    :param ignore: names of properties to keep untouched
+    :param dense_index: dense vid -> index table for standalone ArrayDicts (always used by the shared table)
+    :param shared_index: whether to gather per vertex properties in a PropertyTable
+    :param float_dtype: dtype of floating properties
+    :param dtypes: dtypes forced for some properties instead of inferred ones (see CompositeModel.property_dtypes)
+    :param integer_properties: names of integer properties stored in the most compact integer dtype holding their values
+    :return: conversion report dict with the PropertyTable if used ("table"), the dtype of converted properties ("dtypes"),
+    and the names of properties left as plain dicts because their values are not numeric scalars ("unconverted")
+    """
     props = g.properties()
+    table, vertices = None, None
+    if shared_index:
+        vertices = set(g.vertices(scale=g.max_scale()))
+        table = PropertyTable(keys=sorted(vertices))
+
+    report = dict(table=table, dtypes={}, unconverted=[])
+    converted = {}
     for k, v in props.items():
-        # print(k, v)
-        if isinstance(v, dict) and len(v) > 0 and k not in ignore:
-            assigned_values = [value for value in v.values() if value is not None]
-            if len(assigned_values) > 0:
-                first_element = assigned_values[0]
-                if isinstance(first_element, float) or isinstance(first_element, int) or isinstance(first_element, np.int32) or isinstance(first_element, np.int64) or isinstance(first_element, np.float64):
-                    props[k] = ArrayDict(v)
-        
-        # If any was already existing, recreate it to make sure this is the right version with the invariant vid ordering # TODO remove after ArrayDict is stable
-        elif isinstance(v, ArrayDict):
-            stored = v.to_dict()
-            props[k] = ArrayDict(stored)
-                
\ No newline at end of file
+        if k in ignore:
+            continue
+        if id(v) in converted:
+            props[k] = converted[id(v)][1]
+            report["dtypes"][k] = props[k].dtype
+            continue
+
+        if isinstance(v, ArrayDict):
+            # If any was already existing, recreate it to make sure this is the right version with the invariant vid ordering # TODO remove after ArrayDict is stable
+            keys, values, dtype = v.keys_array(), v.values_array(), v.dtype
+        elif isinstance(v, dict) and len(v) > 0:
+            values, dtype = infer_dtype(list(v.values()), float_dtype=float_dtype)
+            if dtype is None or (dtype.kind == "f" and np.isnan(values).all()):
+                report["unconverted"].append(k)
+                continue
+            keys = np.fromiter(v.keys(), dtype=np.int64, count=len(v))
+        else:
+            continue
+
+        if k in dtypes:
+            dtype = np.dtype(dtypes[k])
+        elif dtype.kind in "iu" and k not in integer_properties:
+            dtype = np.dtype(float_dtype)
+
+        if table is not None and v.keys() == vertices:
+            props[k] = table.add_column(k, dtype=dtype)
+        else:
+            props[k] = ArrayDict(dtype=dtype, dense_index=dense_index, init_capacity=len(keys))
+        props[k].insert_many(keys, values)
+        report["dtypes"][k] = dtype
+        # Source is kept referenced so that its id is not reused during conversion
+        converted[id(v)] = (v, props[k])
+
+    return report
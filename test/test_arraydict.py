@@ -1,5 +1,6 @@
+import pickle
 import numpy as np
-from openalea.metafspm.utils import ArrayDict  # adjust import to your file name
+from openalea.metafspm.utils import ArrayDict, PropertyTable  # adjust import to your file name
 
 # This test checks the invariance of ArrayDict operations
 def test_arraydict():
@@ -16,3 +17,202 @@ def test_arraydict():
     ad.assign_at([0, 2], [7, 8])  # value updates leave order intact
     ad.__delitem__(3)             # deletion
     assert ad.check_invariant()   # confirms sorted order and mapping consistency
+
+
+# This test checks that bulk insertions match the per key behavior
+def test_arraydict_insert_many():
+    ad = ArrayDict({1: 0.1, 4: 0.4})
+    ad.insert_many([6, 2, 4, 9, 2], [0.6, 0.2, 4., 0.9, 2.])  # merge, update and duplicated keys
+    assert list(ad.keys()) == [1, 2, 4, 6, 9]
+    assert ad[2] == 2. and ad[4] == 4.
+    assert ad.check_invariant()
+
+    ad.insert_many(np.arange(10, 1000), 1.)  # monotone extension
+    assert len(ad) == 995 and ad[999] == 1.
+    assert ad.check_invariant()
+
+
+# This test checks that the dense vid -> index table stays consistent with the dict based lookup
+def test_arraydict_dense_index():
+    ad = ArrayDict({3: 0.3, 1: 0.1, 2: 0.2}, dense_index=True)
+    ad[40] = 4.
+    ad.insert_many([0, 7], [0., 0.7])
+    del ad[2]
+    assert np.array_equal(ad.indices_of([40, 0, 7]), [4, 0, 3])
+    assert np.array_equal(ad.contains_many([2, 3, 100, -1]), [False, True, False, False])
+    ad.scatter(np.array([1, 40]), [10., 20.])
+    assert ad[1] == 10. and ad[40] == 20.
+    assert ad.check_invariant()
+
+
+# This test checks that columns of a PropertyTable stay aligned on their shared vertex index
+def test_property_table():
+    table = PropertyTable(keys=[1, 2, 3])
+    struct_mass = table.add_column("struct_mass", {1: 0.1, 2: 0.2, 3: 0.3})
+    length = table.add_column("length", fill_value=-1.)
+    assert length.to_dict() == {1: -1., 2: -1., 3: -1.}
+
+    struct_mass[5] = 0.5                  # insertion through one column reaches every column
+    table.insert([4, 6], length=[0.4, 0.6])
+    del length[2]
+    assert list(struct_mass.keys()) == list(length.keys()) == [1, 3, 4, 5, 6]
+    assert length[5] == -1. and struct_mass[4] == 0.
+    assert np.array_equal(length.values_array(), [-1., -1., 0.4, -1., 0.6])
+    assert table.check_invariant() and length.check_invariant()
+
+
+# This test checks that tombstone deletions are invisible through the mapping and array views
+def test_arraydict_tombstones():
+    ad = ArrayDict({k: float(k) for k in range(10)}, compact_threshold=0.5)
+    del ad[3]
+    ad.delete_many([5, 7])
+    assert ad.index.n_dead == 3 and len(ad) == 7 and 5 not in ad
+    assert list(ad.keys()) == [0, 1, 2, 4, 6, 8, 9]
+    assert np.array_equal(ad.live_mask(), [k not in (3, 5, 7) for k in range(10)])
+    assert ad.check_invariant()
+
+    assert np.array_equal(ad.values_array(), [0., 1., 2., 4., 6., 8., 9.])  # compacted view
+    assert ad.index.n_dead == 0 and ad.check_invariant()
+
+
+# This test checks NumPy interoperability and aligned elementwise operations
+def test_arraydict_numpy_operations():
+    a = ArrayDict({1: 1., 2: 2., 3: 3.})
+    b = ArrayDict({3: 2., 1: 2., 2: 2.})
+    assert np.shares_memory(np.asarray(a), a.arr)
+    assert (a * b + 3.).to_dict() == {1: 5., 2: 7., 3: 9.}
+    assert np.array_equal((a > 1.5).values_array(), [False, True, True])
+    assert np.sum(a) == 6.
+
+    a += b
+    assert a.to_dict() == {1: 3., 2: 4., 3: 5.}
+    try:
+        a + ArrayDict({4: 1.})
+        assert False
+    except ValueError:
+        pass
+
+
+# This test checks that pickling sends live slices only and preserves index sharing
+def test_arraydict_pickle():
+    # Imported here as pickle looks classes up in the module, which other test modules reload
+    from openalea.metafspm.utils import ArrayDict, PropertyTable
+
+    table = PropertyTable(keys=range(1000))
+    table.add_column("struct_mass", fill_value=1.)
+    table.add_column("length", fill_value=2.)
+    table.remove(range(500, 1000))
+    buffers = []
+    payload = pickle.dumps(table, protocol=5, buffer_callback=buffers.append)
+    assert sum(memoryview(b).nbytes for b in buffers) == 3 * 500 * 8  # keys + 2 columns
+    received = pickle.loads(payload, buffers=buffers)
+    assert received["struct_mass"].index is received["length"].index
+    assert received["length"].to_dict() == {k: 2. for k in range(500)}
+    assert received.check_invariant()
+
+    ad = pickle.loads(pickle.dumps(ArrayDict({2: 0.2, 1: 0.1})))
+    assert ad.to_dict() == {1: 0.1, 2: 0.2} and ad.check_invariant()
+
+
+# This test checks the compact dtype inference used for MTG properties conversion
+def test_infer_dtype():
+    from openalea.metafspm.utils import infer_dtype
+
+    assert infer_dtype([1, 2, 7])[1] == np.int8
+    assert infer_dtype([1, 2**20])[1] == np.int32
+    assert infer_dtype([True, False])[1] == bool
+    values, dtype = infer_dtype([None, 0.5])
+    assert dtype == np.float64 and np.isnan(values[0])
+    assert infer_dtype([0.5], float_dtype=np.float32)[1] == np.float32
+    assert infer_dtype(["Apex", "Segment"])[1] is None
+    assert infer_dtype([(0., 1.), (1., 1.)])[1] is None
+
+
+# This test checks that integer valued MTG properties are only narrowed to integers when declared so
+def test_mtg_to_arraydict_dtypes():
+    from openalea.metafspm.utils import mtg_to_arraydict
+
+    class Graph:
+        def __init__(self, props):
+            self.props = props
+        def properties(self):
+            return self.props
+        def vertices(self, scale):
+            return [1, 2]
+        def max_scale(self):
+            return 1
+
+    g = Graph({"C_hexose": {1: 0, 2: 0}, "label": {1: 1, 2: 3}, "order": {1: 1, 2: 2}})
+    report = mtg_to_arraydict(g, dtypes={"label": np.int8}, integer_properties=["order"])
+    assert report["dtypes"] == {"C_hexose": np.float64, "label": np.int8, "order": np.int8}
+    g.props["C_hexose"][2] = 0.7
+    assert g.props["C_hexose"][2] == 0.7
+
+
+# This test checks that broadcast properties only allocate a column on first write
+def test_broadcast_arraydict():
+    from openalea.metafspm.utils import BroadcastArrayDict
+
+    table = PropertyTable(keys=[1, 2, 3])
+    length = table.add_column("length", {1: 1., 2: 2., 3: 3.})
+    temperature = BroadcastArrayDict(20., index=table.index)
+    assert temperature.to_dict() == {1: 20., 2: 20., 3: 20.}
+    assert (length * temperature).to_dict() == {1: 20., 2: 40., 3: 60.}
+    table.insert([4])
+    assert temperature[4] == 20. and not temperature.materialized
+
+    temperature[2] = 15.
+    table.insert([5])
+    assert temperature.materialized and temperature.to_dict() == {1: 20., 2: 15., 3: 20., 4: 20., 5: 20.}
+    assert temperature.check_invariant()
+
+    # In place operations write the broadcast property like any other write
+    moisture = BroadcastArrayDict(0.5, index=table.index)
+    moisture += 1.
+    assert moisture.materialized and moisture.to_dict() == {k: 1.5 for k in range(1, 6)}
+    np.add(moisture, length * 0. + 1., out=moisture)
+    assert moisture[5] == 2.5
+
+
+# This test checks that focus elements positions are cached until the structure or the focus set changes
+def test_focus_elements():
+    from openalea.metafspm.utils import FocusElements
+
+    table = PropertyTable(keys=[1, 2, 3, 4])
+    focus = FocusElements(table.index, [4, 2])
+    assert list(focus) == [2, 4] and 3 not in focus
+    slots = focus.slots()
+    assert slots.tolist() == [1, 3] and focus.slots() is slots
+
+    table.insert([0])
+    assert focus.slots().tolist() == [2, 4]
+    table.insert([5])
+    focus.add([5])
+    assert focus.slots().tolist() == [2, 4, 5]
+    assert focus.mask().tolist() == [False, False, True, False, True, True]
+
+    version = focus.version
+    table.remove([4])
+    assert list(focus) == [2, 5] and focus.version > version
+    assert focus.slots().tolist() == [2, 4]
+
+
+# This test checks that focus elements can be edited as the lists growth models use
+def test_focus_elements_list_operations():
+    from openalea.metafspm.utils import FocusElements
+
+    table = PropertyTable(keys=range(1, 9))
+    focus = FocusElements(table.index, [2, 4])
+    focus.extend([6, 5])
+    focus += [1]
+    focus.insert(0, 8)
+    assert focus == [1, 2, 4, 5, 6, 8] and focus != [1, 2]
+    version = focus.version
+    focus[0] = 3
+    assert focus == [2, 3, 4, 5, 6, 8] and focus.version > version
+    focus[1:3] = [7]
+    assert focus == [2, 5, 6, 7, 8]
+    del focus[-1]
+    del focus[:2]
+    assert focus == [6, 7] and focus.slots().tolist() == [5, 6]
+    assert focus.pop() == 7 and focus == [6]
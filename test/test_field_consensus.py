@@ -4,4 +4,45 @@ from openalea.metafspm.component import declare
 def test_field_consensus():
     f: float = declare(default=0., min_value=0., max_value=1., unit="mol.s-1", unit_comment="test", description="",
                   value_comment="", references="", DOI="", variable_type="", by="", state_variable_type="", edit_by="")
-    assert f.default == 0.
\ No newline at end of file
+    assert f.default == 0.
+
+def test_declared_dtype_and_precision_policy():
+    import numpy as np
+    from dataclasses import dataclass
+    from openalea.metafspm.component import Model
+
+    @dataclass
+    class Precise(Model):
+        flux: float = declare(default=0., min_value="", max_value="", unit="mol.s-1", unit_comment="", description="",
+                    value_comment="", references="", DOI="", variable_type="state_variable", by="", state_variable_type="NonInertialExtensive", edit_by="")
+        content: float = declare(default=0., min_value="", max_value="", unit="mol", unit_comment="", description="",
+                    value_comment="", references="", DOI="", variable_type="state_variable", by="", state_variable_type="extensive", edit_by="")
+        label: int = declare(default=1, min_value="", max_value="", unit="", unit_comment="", description="",
+                    value_comment="", references="", DOI="", variable_type="state_variable", by="", state_variable_type="descriptor", edit_by="", dtype=np.int8)
+
+    model = Precise()
+    assert model.dtype_of("flux") is None
+    model.apply_scenario(precision_policy={"NonInertialExtensive": np.float32, "state_variable": np.float64})
+    assert model.dtype_of("flux") == np.float32
+    assert model.dtype_of("content") == np.float64
+    assert model.dtype_of("label") == np.int8
+
+
+def test_property_dtypes_from_annotations():
+    import numpy as np
+    from dataclasses import dataclass
+    from types import SimpleNamespace
+    from openalea.metafspm.component import Model
+    from openalea.metafspm.composite_wrapper import CompositeModel
+
+    @dataclass
+    class Annotated(Model):
+        content: float = declare(default=0., min_value="", max_value="", unit="mol", unit_comment="", description="",
+                    value_comment="", references="", DOI="", variable_type="state_variable", by="", state_variable_type="extensive", edit_by="")
+        label: int = declare(default=1, min_value="", max_value="", unit="", unit_comment="", description="",
+                    value_comment="", references="", DOI="", variable_type="state_variable", by="", state_variable_type="descriptor", edit_by="", dtype=np.int8)
+        order: int = declare(default=1, min_value="", max_value="", unit="", unit_comment="", description="",
+                    value_comment="", references="", DOI="", variable_type="state_variable", by="", state_variable_type="descriptor", edit_by="")
+
+    dtypes = CompositeModel.property_dtypes(SimpleNamespace(components=[Annotated()]))
+    assert dtypes == {"content": np.float64, "label": np.int8, "order": np.int64}
@@ -0,0 +1,714 @@
+import pytest
+import numpy as np
+from openalea.metafspm.component_factory import Functor, FunctorPlan, Choregrapher
+from openalea.metafspm.specializer import specialize_method_recursive
+from openalea.metafspm.utils import ArrayDict, PropertyTable, ScalarProperty
+
+
+class Plant:
+    coefficient = 2.
+    visited = 0
+
+    def _total_length(self, length):
+        return self.coefficient * np.sum(length)
+
+    def _total_mass(self, struct_mass, total_length):
+        return sum(struct_mass.values()) + total_length[1]
+
+    def _growth(self, length, struct_mass):
+        return np.where(length > 1.5, self.coefficient * struct_mass, 0.)
+
+    def _density(self, length, struct_mass):
+        if length > 1.5:
+            return struct_mass / length
+        else:
+            return 0.
+
+    def _visits(self, length):
+        self.visited += 1
+        return self.visited
+
+
+ARRAYDICT = ArrayDict
+
+
+def make_data():
+    # Imported here since other test modules reload the package
+    from openalea.metafspm.utils import PropertyTable, ScalarProperty
+
+    table = PropertyTable(keys=[1, 2, 3])
+    return {"length": table.add_column("length", {1: 1., 2: 2., 3: 3.}),
+            "struct_mass": table.add_column("struct_mass", {1: 0.1, 2: 0.1, 3: 0.1}),
+            "growth": table.add_column("growth"), "density": table.add_column("density"), "visits": table.add_column("visits"),
+            "vertex_index": table.index, "focus_elements": [1, 3],
+            "total_length": ScalarProperty(0.), "total_mass": ScalarProperty(0.)}
+
+
+# This test checks that total functors write plant scale scalars, through a specialized reduction when possible
+def test_total_functor():
+    plant, data = Plant(), make_data()
+
+    total_length = Functor(Plant._total_length, total=True)
+    total_length.fun, _ = specialize_method_recursive(total_length.fun, plant)
+    total_length.numba_speedup = True
+    total_length(plant, data, ARRAYDICT)
+    assert data["total_length"].value == 12.
+
+    total_mass = Functor(Plant._total_mass, total=True)
+    total_mass(plant, data, ARRAYDICT)
+    assert np.isclose(data["total_mass"][1], 12.3)
+
+
+# This test checks that numpy-safe and branchy processes are called once on gathered arrays, and others per element
+def test_whole_array_tier():
+    plant, data = Plant(), make_data()
+
+    growth = Functor(Plant._growth)
+    growth(plant, data, ARRAYDICT)
+    assert growth.numpy_vectorized
+    assert data["growth"].to_dict() == {1: 0., 2: 0., 3: 0.2}
+
+    density = Functor(Plant._density)
+    density(plant, data, ARRAYDICT)
+    assert density.numpy_vectorized
+    assert np.allclose(data["density"].values_array(), [0., 0., 0.1 / 3.])
+
+    visits = Functor(Plant._visits)
+    visits(plant, data, ARRAYDICT)
+    assert visits.numpy_vectorized is False
+    assert data["visits"].to_dict() == {1: 1., 2: 0., 3: 2.}
+
+
+# This test checks that scalar branches, min/max and math calls are rewritten as numpy operations
+def test_vectorize_method():
+    import math
+    from openalea.metafspm.specializer import vectorize_method
+
+    class Root:
+        threshold = 1.
+
+        def _bounded(self, x):
+            return min(max(x, 0.), self.threshold)
+
+        def _flux(self, a, b):
+            if a > self.threshold and b > 0:
+                return math.sqrt(a) / b
+            elif a < 0:
+                return self._bounded(b)
+            return 0.
+
+        def _either(self, a, b):
+            return a or b
+
+        def _ratio(self, a, b):
+            c = a if a > 0 else -a
+            return c / b
+
+    flux = vectorize_method(Root._flux, Root)
+    a, b = np.array([4., 4., -1., 0.5]), np.array([2., 0., 3., 1.])
+    expected = [Root._flux(Root(), x, y) for x, y in zip(a, b)]
+    assert np.allclose(flux(Root(), a, b), expected)
+
+    # and/or as values evaluate to an operand, not to a boolean
+    assert vectorize_method(Root._either, Root) is None
+    # Floating point errors are only ignored in branches
+    ratio = vectorize_method(Root._ratio, Root)
+    with np.errstate(divide="raise", invalid="raise"):
+        assert np.allclose(ratio(Root(), a, np.array([2., 1., 3., 1.])), [2., 4., 1/3, 0.5])
+        with pytest.raises(FloatingPointError):
+            ratio(Root(), a, b)
+
+
+# This test checks that functor plans are resolved once, and again after structural changes of the data
+def test_functor_plan():
+    plant, data = Plant(), make_data()
+    plan = FunctorPlan(Functor(Plant._growth), plant, data, ARRAYDICT, Choregrapher())
+    plan()
+    run = plan.run
+    plan()
+    assert plan.run is run
+    assert data["growth"].to_dict() == {1: 0., 2: 0., 3: 0.2}
+
+    # Segmentation-like insertion of a new vertex in the focus elements
+    data["length"].insert_many([4], [2.])
+    data["struct_mass"][4] = 0.5
+    data["focus_elements"] = [1, 3, 4]
+    plan()
+    assert plan.run is not run
+    assert data["growth"].to_dict() == {1: 0., 2: 0., 3: 0.2, 4: 1.}
+
+    # Coupling replacing properties
+    run = plan.run
+    Choregrapher().invalidate_plans()
+    plan()
+    assert plan.run is not run
+
+    # Property replaced between steps without structural edit
+    data["struct_mass"] = data["struct_mass"] * 2.
+    plan()
+    assert data["growth"].to_dict() == {1: 0., 2: 0., 3: 0.4, 4: 2.}
+
+
+# This test checks that focus elements are built once as shared FocusElements for array based data
+def test_update_focus_elements():
+    table = PropertyTable(keys=[1, 2, 3])
+    data = {"struct_mass": table.add_column("struct_mass", {1: 0.1, 2: 0., 3: 0.1}),
+            "label": table.add_column("label", {1: 1, 2: 1, 3: 3}, dtype=np.int8),
+            "type": table.add_column("type", {1: 1, 2: 1, 3: 1}, dtype=np.int8)}
+    Choregrapher().update_focus_elements(data)
+    focus = data["focus_elements"]
+    assert type(focus).__name__ == "FocusElements" and list(focus) == [1]
+    Choregrapher().update_focus_elements(data)
+    assert data["focus_elements"] is focus
+
+    data["focus_elements"] = [1, 3]
+    Choregrapher().update_focus_elements(data)
+    assert data["focus_elements"].slots().tolist() == [0, 2] and data["focus_elements"] == [1, 3]
+
+    # Dict based data keeps the list provided by growth models
+    focus = [1, 3]
+    data = {"struct_mass": {1: 0.1, 2: 0.1, 3: 0.1}, "focus_elements": focus}
+    Choregrapher().update_focus_elements(data)
+    assert data["focus_elements"] is focus
+
+
+# This test checks that numba kernels run on whole arrays when focus elements cover most vertices, and gather otherwise
+def test_dense_dispatch():
+    plant, data = Plant(), make_data()
+    growth = Functor(Plant._growth)
+    growth.fun, _ = specialize_method_recursive(growth.fun, plant)
+    growth.numba_speedup = True
+    growth.dense_coverage_threshold = 0.5
+
+    # Non focus elements keep their value
+    data["growth"][2] = -1.
+    growth(plant, data, ARRAYDICT)
+    assert data["growth"].to_dict() == {1: 0., 2: -1., 3: 0.2}
+    assert growth.dispatch_stats()["dense_calls"] == 1
+
+    data["focus_elements"] = [3]
+    growth(plant, data, ARRAYDICT)
+    stats = growth.dispatch_stats()
+    assert data["growth"].to_dict() == {1: 0., 2: -1., 3: 0.2}
+    assert stats["gather_calls"] == 1 and stats["gather_fraction"] == 0.5
+
+
+# This test checks that kernels that are not elementwise are always given the focus elements only
+def test_dense_dispatch_elementwise_only():
+    from openalea.metafspm.component_factory import Functor
+    from openalea.metafspm.utils import ArrayDict
+
+    class Root:
+        def _share(self, length):
+            return length / np.sum(length)
+
+    root, data = Root(), make_data()
+    data["share"] = data["length"] * 0.
+    results = []
+    for threshold in (0.5, 2.):
+        share = Functor(Root._share)
+        kernel, _ = specialize_method_recursive(share.fun, root)
+        share.install(kernel)
+        share.dense_coverage_threshold = threshold
+        share(root, data, ArrayDict)
+        assert share.dispatch_stats()["dense_calls"] == 0
+        results.append(data["share"].values_array().copy())
+    assert np.allclose(results[0], results[1]) and np.isclose(results[0][0], 0.25)
+
+
+# This test checks that fused functors give the same results as their serial execution, including read-after-write
+def test_kernel_fusion():
+    from openalea.metafspm.component_factory import Functor, FunctorPlan, FusedPlan, Choregrapher
+    from openalea.metafspm.specializer import specialize_method_recursive
+
+    class Carbon:
+        yield_coefficient = 0.5
+
+        def _growth(self, length, struct_mass):
+            return np.where(length > 1.5, 2. * struct_mass, 0.)
+
+        def _respiration(self, growth, total_length):
+            return self.yield_coefficient * growth + total_length
+
+    carbon, data = Carbon(), make_data()
+    data["respiration"] = data["length"] * 0.
+    data["total_length"].value = 1.
+    plans = []
+    for fun in (Carbon._growth, Carbon._respiration):
+        functor = Functor(fun)
+        functor.fun, _ = specialize_method_recursive(functor.fun, carbon)
+        functor.numba_speedup = True
+        plans.append(FunctorPlan(functor, carbon, data, ARRAYDICT, Choregrapher()))
+
+    fused = FusedPlan(plans)
+    fused()
+    assert fused.fused
+    assert data["growth"].to_dict() == {1: 0., 2: 0., 3: 0.2}
+    assert np.allclose(data["respiration"].values_array(), [1., 0., 1.1])
+
+
+# This test checks that independent functors of a group are run concurrently after the ones they depend on
+def test_parallel_waves():
+    from openalea.metafspm.component_factory import Functor, FunctorPlan, Choregrapher, dependency_waves
+    from openalea.metafspm.specializer import specialize_method_recursive
+    from openalea.metafspm.utils import ArrayDict
+
+    class Carbon:
+        def _growth(self, length, struct_mass):
+            return np.where(length > 1.5, 2. * struct_mass, 0.)
+
+        def _respiration(self, growth):
+            return 0.5 * growth
+
+        def _exudation(self, length):
+            return 0.1 * length
+
+    carbon, data = Carbon(), make_data()
+    data["respiration"], data["exudation"] = data["length"] * 0., data["length"] * 0.
+    choregrapher = Choregrapher()
+    plans = []
+    for fun in (Carbon._growth, Carbon._respiration, Carbon._exudation):
+        functor = Functor(fun)
+        functor.fun, _ = specialize_method_recursive(functor.fun, carbon, nogil=True)
+        functor.numba_speedup = functor.fun_nogil = True
+        plans.append(FunctorPlan(functor, carbon, data, ArrayDict, choregrapher))
+
+    waves = dependency_waves(plans)
+    assert [[plan.functor.name for plan in wave] for wave in waves] == [["growth", "exudation"], ["respiration"]]
+
+    choregrapher.parallel_workers = 2
+    try:
+        for wave in waves:
+            choregrapher.run_wave(wave)
+    finally:
+        del choregrapher.parallel_workers
+    assert data["growth"].to_dict() == {1: 0., 2: 0., 3: 0.2}
+    assert np.allclose(data["respiration"].values_array(), [0., 0., 0.1])
+    assert np.allclose(data["exudation"].values_array(), [0.1, 0., 0.3])
+
+
+# This test checks that specialized kernels are content addressed in the persistent cache and reloaded from it
+def test_kernel_cache(tmp_path):
+    from openalea.metafspm import specializer
+
+    class Root:
+        coefficient = 3.
+
+        def _flux(self, length):
+            return self.coefficient * length
+
+    specializer.set_kernel_cache_dir(str(tmp_path))
+    try:
+        flux, _ = specializer.specialize_method_recursive(Root._flux, Root())
+        assert np.allclose(flux(np.ones(2)), 3.)
+        assert len(list(tmp_path.glob("_flux_*.py"))) == 1
+
+        # Same kernel in a new process, which loads its compiled version from disk
+        specializer.clear_specializations()
+        flux, _ = specializer.specialize_method_recursive(Root._flux, Root())
+        assert np.allclose(flux(np.ones(2)), 3.)
+        assert sum(flux.stats.cache_hits.values()) > 0
+
+        other = Root()
+        other.coefficient = 2.
+        specializer.specialize_method_recursive(Root._flux, other)
+        assert len(list(tmp_path.glob("_flux_*.py"))) == 2
+    finally:
+        specializer.set_kernel_cache_dir(None)
+
+
+# This test checks that a kernel source published by another process in between is kept as is
+def test_kernel_cache_publication(tmp_path, monkeypatch):
+    import os
+    from openalea.metafspm import specializer
+
+    gen_src = "def _flux(length):\n    return 2. * length"
+    path = tmp_path / "_flux_published.py"
+    path.write_text(gen_src + "\n")
+    inode = path.stat().st_ino
+    # The file appears after the existence check
+    monkeypatch.setattr(os.path, "exists", lambda p: False)
+    flux = specializer._load_cached_source("_flux", gen_src, {}, "published", str(tmp_path))
+    assert flux(1.) == 2.
+    assert path.stat().st_ino == inode and list(tmp_path.glob("*.tmp")) == []
+
+
+# This test checks that specialized kernels are shared in the process by instances with the same parameters
+def test_shared_specializations():
+    from openalea.metafspm.specializer import specialize_method_recursive
+
+    class Root:
+        coefficient = 3.
+
+        def _temperature_modification(self, x):
+            return self.coefficient * x
+
+        def _flux(self, length):
+            return self._temperature_modification(length)
+
+        def _uptake(self, length):
+            return self._temperature_modification(length) + 1.
+
+    flux, registry = specialize_method_recursive(Root._flux, Root())
+    other_flux, other_registry = specialize_method_recursive(Root._flux, Root())
+    assert other_flux is flux
+    _, uptake_registry = specialize_method_recursive(Root._uptake, Root())
+    assert uptake_registry["_temperature_modification"]["jit"] is registry["_temperature_modification"]["jit"]
+
+    other = Root()
+    other.coefficient = 2.
+    assert specialize_method_recursive(Root._flux, other)[0] is not flux
+
+    # Kernels eagerly compiled for argument types are shared for the same types only
+    import numba
+    typed, _ = specialize_method_recursive(Root._flux, Root(), signature=(numba.float64[::1],))
+    assert specialize_method_recursive(Root._flux, Root(), signature=(numba.float64[::1],))[0] is typed
+    narrow, _ = specialize_method_recursive(Root._flux, Root(), signature=(numba.float32[::1],))
+    assert narrow is not typed and [sig[0].dtype for sig in narrow.signatures] == [numba.float32]
+
+
+# This test checks that parametric kernels are compiled once and read the parameters of each instance
+def test_parametric_specialization():
+    from functools import partial
+    from openalea.metafspm.component_factory import Functor
+    from openalea.metafspm.specializer import specialize_method_recursive, pack_parameters
+    from openalea.metafspm.utils import ArrayDict
+
+    class Root:
+        coefficient = 2.
+
+        def _growth(self, length, struct_mass):
+            return np.where(length > 1.5, self.coefficient * struct_mass, 0.)
+
+    results = []
+    kernels = []
+    for coefficient in (2., 4.):
+        root, data = Root(), make_data()
+        root.coefficient = coefficient
+        growth = Functor(Root._growth)
+        registry = {}
+        growth.fun, _ = specialize_method_recursive(growth.fun, root, registry=registry, parametric=True)
+        growth.numba_speedup = True
+        growth.parameters = partial(pack_parameters, registry, "_growth", root)
+        growth(root, data, ArrayDict)
+        results.append(data["growth"][3])
+        kernels.append(growth.fun)
+
+    assert kernels[0] is kernels[1]
+    assert np.allclose(results, [0.2, 0.4])
+
+
+# This test checks that a functor compiled in background runs on python tiers until its kernel is installed
+def test_background_compilation():
+    from openalea.metafspm.component_factory import Choregrapher, Functor, FunctorPlan
+    from openalea.metafspm.utils import ArrayDict
+
+    class Root:
+        coefficient = 3.
+
+        def _growth(self, length, struct_mass):
+            return np.where(length > 1.5, self.coefficient * struct_mass, 0.)
+
+    root, data = Root(), make_data()
+    choregrapher = Choregrapher()
+    growth = Functor(Root._growth)
+    plan = FunctorPlan(growth, root, data, ArrayDict, choregrapher)
+    plan()
+    assert not growth.numba_speedup
+
+    choregrapher.submit_specialization(growth, root, data)
+    choregrapher.wait_for_compilation()
+    assert growth.pending is not None and not growth.numba_speedup
+    data["length"][1] = 2.
+    plan()
+    assert growth.numba_speedup and growth.pending is None
+    assert growth.stats["dense_calls"] + growth.stats["gather_calls"] == 1
+    assert np.allclose(data["growth"].values_array(), [0.3, 0., 0.3])
+
+
+# This test checks that specialization failures are reported, and that processes can opt out of specialization
+def test_specialization_report():
+    from openalea.metafspm.component_factory import Choregrapher, Functor, specialized
+
+    class Root:
+        lookup = {"fine": 2., "coarse": 1.}
+        coefficient = 2.
+
+        def _uptake(self, length):
+            return sum(self.lookup.values()) * length
+
+        @specialized(False)
+        def _growth(self, length):
+            return self.coefficient * length
+
+    root, data = Root(), make_data()
+    uptake, growth = Functor(Root._uptake), Functor(Root._growth)
+    Choregrapher().specialize(uptake, root, data)
+    report = uptake.specialization_report()
+    assert report["tier"] == "python, not run yet"
+    assert report["failure"] == "unsupported attribute type: self.lookup (dict)"
+    assert report["compile_time"] > 0.
+    assert growth.specialization is False
+
+
+# This test checks that families left unspecialized by default follow the specialization_mode their model sets
+def test_unspecialized_families():
+    from dataclasses import dataclass
+    from openalea.metafspm.component import Model
+    from openalea.metafspm.component_factory import Choregrapher
+
+    @dataclass
+    class RootAnatomy(Model):
+        pass
+
+    choregrapher = Choregrapher()
+    assert choregrapher.specialization_mode(RootAnatomy()) is None
+    anatomy = RootAnatomy()
+    anatomy.apply_scenario(specialization_mode="parametric")
+    assert choregrapher.specialization_mode(anatomy) == "parametric"
+
+    @dataclass
+    class RootAnatomy(Model):
+        specialization_mode = "constant"
+
+    assert choregrapher.specialization_mode(RootAnatomy()) == "constant"
+
+
+# This test checks that dict and list parameters, helper keyword arguments and named supplementary outputs are specialized
+def test_wider_specialization():
+    from openalea.metafspm.component_factory import Functor, FunctorPlan, FusedPlan, Choregrapher
+    from openalea.metafspm.specializer import specialize_method_recursive
+    from openalea.metafspm.utils import ArrayDict
+
+    class Root:
+        rates = {"growth": 2., "respiration": {"maintenance": 0.5}}
+        thresholds = [1, 2.5]
+
+        def _modification(self, length, T_ref=1., scale=1.):
+            return scale * length + T_ref
+
+        def _growth(self, length, struct_mass) -> tuple[float, str, float]:
+            return self.rates["growth"] * struct_mass * self._modification(length, scale=2.), "density", length + self.thresholds[1]
+
+        def _respiration(self, density):
+            return self.rates["respiration"]["maintenance"] * density
+
+    root, data = Root(), make_data()
+    data["respiration"] = data["length"] * 0.
+    plans = []
+    for fun in (Root._growth, Root._respiration):
+        functor = Functor(fun)
+        functor.fun, _ = specialize_method_recursive(functor.fun, root)
+        assert functor.fun is not None
+        functor.numba_speedup = True
+        plans.append(FunctorPlan(functor, root, data, ArrayDict, Choregrapher()))
+    assert plans[0].functor.supplementary_names == ["density"]
+
+    fused = FusedPlan(plans)
+    fused()
+    assert fused.fused
+    assert np.allclose(data["growth"].values_array(), [0.6, 0., 1.4])
+    assert np.allclose(data["density"].values_array(), [3.5, 0., 5.5])
+    assert np.allclose(data["respiration"].values_array(), [1.75, 0., 2.75])
+
+
+# This test checks that kernels specialized in numba parallel mode, fused or not, give the serial results
+def test_parallel_kernels(monkeypatch):
+    from openalea.metafspm.component_factory import Functor, FunctorPlan, FusedPlan, Choregrapher
+    from openalea.metafspm.specializer import specialize_method_recursive
+    from openalea.metafspm.utils import ArrayDict
+
+    class Carbon:
+        yield_coefficient = 0.5
+
+        def _growth(self, length, struct_mass):
+            return np.where(length > 1.5, 2. * struct_mass, 0.)
+
+        def _respiration(self, growth, total_length):
+            return self.yield_coefficient * growth + total_length
+
+    carbon, data = Carbon(), make_data()
+    data["respiration"] = data["length"] * 0.
+    data["total_length"].value = 1.
+    plans = []
+    for fun in (Carbon._growth, Carbon._respiration):
+        functor = Functor(fun)
+        kernel, _ = specialize_method_recursive(functor.fun, carbon, parallel=True)
+        functor.install(kernel, parallel=True)
+        plans.append(FunctorPlan(functor, carbon, data, ArrayDict, Choregrapher()))
+
+    plans[0]()
+    assert plans[0].functor.numba_speedup
+    assert data["growth"].to_dict() == {1: 0., 2: 0., 3: 0.2}
+    fused = FusedPlan(plans)
+    fused()
+    assert fused.fused
+    assert np.allclose(data["respiration"].values_array(), [1., 0., 1.1])
+
+    # Numba parallel warnings are only ignored while compiling kernels, later calls leave the caller's filters untouched
+    import warnings, numba
+    from openalea.metafspm import specializer
+    filters = list(warnings.filters)
+    compilations = []
+    ignored = specializer.parallel_warnings_ignored
+    monkeypatch.setattr(specializer, "parallel_warnings_ignored", lambda: compilations.append(1) or ignored())
+    plans = [FunctorPlan(plan.functor, carbon, data, ArrayDict, Choregrapher()) for plan in plans]
+    for _ in range(3):
+        plans[0]()
+        plans[1]()
+    assert len(compilations) == 2
+    assert warnings.filters == filters
+    with pytest.warns(numba.NumbaPerformanceWarning):
+        warnings.warn(numba.NumbaPerformanceWarning("The keyword argument 'parallel=True' was specified"))
+
+
+# This test checks that profiled functor calls are recorded and exported as a CSV summary and a Chrome trace
+def test_profiling(tmp_path):
+    import csv, json
+    from openalea.metafspm.component_factory import Choregrapher, Functor, FunctorPlan
+    from openalea.metafspm.specializer import specialize_method_recursive
+    from openalea.metafspm.utils import ArrayDict
+
+    plant, data = Plant(), make_data()
+    growth = Functor(Plant._growth)
+    kernel, _ = specialize_method_recursive(growth.fun, plant)
+    growth.install(kernel)
+    choregrapher = Choregrapher()
+    plan = FunctorPlan(growth, plant, data, ArrayDict, choregrapher)
+    plan()
+
+    profiler = choregrapher.start_profiling()
+    profiler.family = "Plant"
+    plan()
+    plan()
+    assert choregrapher.stop_profiling() is profiler
+    plan()
+    assert len(profiler.events) == 2
+    event = profiler.events[0]
+    assert event["family"] == "Plant" and event["process"] == "growth"
+    assert event["tier"] == "numba" and event["elements"] == 2
+    assert event["gather"] > 0. and event["scatter"] > 0. and event["duration"] >= event["gather"] + event["scatter"]
+
+    profiler.to_csv(tmp_path / "summary.csv")
+    with open(tmp_path / "summary.csv") as f:
+        rows = list(csv.DictReader(f))
+    assert len(rows) == 1 and rows[0]["calls"] == "2" and float(rows[0]["share"]) == 1.
+    profiler.to_chrome_trace(tmp_path / "trace.json")
+    with open(tmp_path / "trace.json") as f:
+        trace = json.load(f)["traceEvents"]
+    assert [event["ph"] for event in trace] == ["X", "X"] and trace[0]["cat"] == "Plant"
+
+
+# This test checks that kernels that are not elementwise are not fused
+def test_fusion_elementwise_only():
+    from openalea.metafspm.component_factory import Functor, FunctorPlan, Choregrapher, fuse_plans
+    from openalea.metafspm.specializer import specialize_method_recursive, is_elementwise
+    from openalea.metafspm.utils import ArrayDict
+
+    class Root:
+        def _share(self, length):
+            return length / np.sum(length)
+
+        def _growth(self, share):
+            return 2. * share
+
+    root, data = Root(), make_data()
+    data["share"] = data["length"] * 0.
+    plans = []
+    for fun in (Root._share, Root._growth):
+        functor = Functor(fun)
+        kernel, _ = specialize_method_recursive(functor.fun, root)
+        functor.install(kernel)
+        plans.append(FunctorPlan(functor, root, data, ArrayDict, Choregrapher()))
+    assert not is_elementwise(plans[0].functor.fun) and is_elementwise(plans[1].functor.fun)
+    assert fuse_plans(plans) == plans
+
+
+# This test checks that fused kernels only materialize the broadcast properties they write
+def test_fusion_broadcast_inputs():
+    from openalea.metafspm.component_factory import Functor, FunctorPlan, FusedPlan, Choregrapher
+    from openalea.metafspm.specializer import specialize_method_recursive
+    from openalea.metafspm.utils import ArrayDict, BroadcastArrayDict
+
+    class Root:
+        def _growth(self, length, temperature):
+            return temperature * length
+
+        def _respiration(self, growth, temperature):
+            return 0.5 * growth + temperature
+
+    root, data = Root(), make_data()
+    data["temperature"] = BroadcastArrayDict(2., index=data["length"].index)
+    data["respiration"] = BroadcastArrayDict(0., index=data["length"].index)
+    plans = []
+    for fun in (Root._growth, Root._respiration):
+        functor = Functor(fun)
+        kernel, _ = specialize_method_recursive(functor.fun, root)
+        functor.install(kernel)
+        plans.append(FunctorPlan(functor, root, data, ArrayDict, Choregrapher()))
+    fused = FusedPlan(plans)
+    fused()
+    assert fused.fused
+    assert not data["temperature"].materialized and data["respiration"].materialized
+    assert data["respiration"].to_dict() == {1: 3., 2: 0., 3: 5.}
+
+
+# This test checks that kernels analysed for fusion can still be garbage collected
+def test_kernel_analysis_weak():
+    import gc, weakref
+    from openalea.metafspm.specializer import is_elementwise, writes_arguments
+
+    def _growth(self, length):
+        return 2. * length
+
+    assert is_elementwise(_growth) and not writes_arguments(_growth)
+    reference = weakref.ref(_growth)
+    del _growth
+    gc.collect()
+    assert reference() is None
+
+
+# This test checks that kernels writing their arguments in place do not alter stored properties
+def test_kernel_arguments_readonly():
+    from openalea.metafspm.component_factory import Functor
+    from openalea.metafspm.specializer import specialize_method_recursive
+    from openalea.metafspm.utils import ArrayDict
+
+    class Root:
+        def _growth(self, length):
+            length *= 2.
+            return length
+
+        def _total_length(self, length):
+            length *= 2.
+            return np.sum(length)
+
+    root, data = Root(), make_data()
+    data["focus_elements"] = [1, 2, 3]
+    data["total_length"].value = 0.
+    growth, total_length = Functor(Root._growth), Functor(Root._total_length, total=True)
+    for functor in (growth, total_length):
+        kernel, _ = specialize_method_recursive(functor.fun, root)
+        functor.install(kernel)
+    growth(root, data, ArrayDict)
+    total_length(root, data, ArrayDict)
+    assert data["length"].to_dict() == {1: 1., 2: 2., 3: 3.}
+    assert data["growth"].to_dict() == {1: 2., 2: 4., 3: 6.}
+    assert data["total_length"].value == 12.
+
+
+# This test checks that functors reading properties left as plain dicts are computed per element
+def test_dict_input():
+    from openalea.metafspm.component_factory import Functor, FunctorPlan, Choregrapher
+    from openalea.metafspm.utils import ArrayDict
+
+    class Root:
+        def _growth(self, length, label):
+            return 2. * length if label == "Apex" else 0.
+
+    root, data = Root(), make_data()
+    data["label"] = {1: "Apex", 2: "Segment", 3: "Segment"}
+    plan = FunctorPlan(Functor(Root._growth), root, data, ArrayDict, Choregrapher())
+    plan()
+    assert data["growth"].to_dict() == {1: 2., 2: 0., 3: 0.}
+
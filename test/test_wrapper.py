@@ -7,3 +7,50 @@ class Model(CompositeModel):
 
 def test_import_composite():
     composite_model = Model()
+
+
+# This test checks that the precision policy of a composite is applied to the state variables its components already stored
+def test_composite_precision_policy(tmp_path):
+    import yaml
+    import numpy as np
+    from dataclasses import dataclass
+    from openalea.metafspm.component import Model, declare
+    from openalea.metafspm.composite_wrapper import CompositeModel
+    from openalea.metafspm.utils import PropertyTable
+
+    @dataclass
+    class Exudation(Model):
+        hexose: float = declare(default=0., unit="mol.g-1", unit_comment="", description="", 
+                                min_value="", max_value="", value_comment="", references="", DOI="", 
+                                variable_type="state_variable", by="", state_variable_type="massic_concentration", edit_by="")
+        hexose_exudation: float = declare(default=0., unit="mol.s-1", unit_comment="", description="", 
+                                min_value="", max_value="", value_comment="", references="", DOI="", 
+                                variable_type="state_variable", by="", state_variable_type="NonInertialExtensive", edit_by="")
+
+        def __init__(self, g_properties):
+            self.props = g_properties
+            self.vertices = list(self.props["struct_mass"].keys())
+            self.link_self_to_mtg()
+
+    class Plant(CompositeModel):
+        precision_policy = {"NonInertialExtensive": np.float32}
+
+    # Only the properties of the MTG are used for coupling
+    class Tree:
+        def properties(self):
+            return props
+
+    table = PropertyTable(keys=[1, 2, 3])
+    props = {"struct_mass": table.add_column("struct_mass", {1: 0.1, 2: 0.1, 3: 0.1})}
+    exudation = Exudation(props)
+    props["hexose_exudation"][2] = 1.
+    assert props["hexose_exudation"].dtype == np.float64
+
+    with open(tmp_path / "coupling_translator.yaml", "w") as f:
+        yaml.dump({"Exudation": {"SoilModel": {}}, "SoilModel": {"Exudation": {}}}, f)
+    plant = Plant()
+    plant.declare_data(root=Tree())
+    plant.couple_components(exudation, translator_path=str(tmp_path))
+
+    assert props["hexose_exudation"].dtype == np.float32 and props["hexose"].dtype == np.float64
+    assert props["hexose_exudation"].to_dict() == {1: 0., 2: 1., 3: 0.}